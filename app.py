@@ -1,34 +1,77 @@
 import pygame
 import time
 import sys
+import os
 import math
 import structure
 import button
 import draw
 import physics
+import spatial
+import storage
+import history
+import export
+import profiler
+import solver
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, the screen positions are worked out in pure python without it
+    numpy = None
 
 SELECTOR = 0
 POINT = 1
 FIXED = 2
 BEAM = 3
 
+MIN_GRID_SPACING = 10  # grid lines closer than this many pixels are thinned out
+NODE_DETAIL_SCALE = 10  # below this scale the nodes are too small to be worth drawing
+
+SOLVED = pygame.USEREVENT  # posted by the background solver so that the idle loop wakes up
+IDLE_TIMEOUT = 500  # the longest (in milliseconds) the loop waits for an event while idle
+
+# the simulation uses a much softer material than steel so that the movement can be seen
+# (and the time step is long enough for it to run in real time)
+SIMULATION_YOUNGS_MODULUS = 1e7
+SETTLED_SPEED = 1e-3  # the simulation stops animating once every node is slower than this
+
 
 class App:
-    def __init__(self, window_size):
+    def __init__(self, window_size, file_path="structure.bridge"):
         self.locked_fixed = True  # for now to stop fixed nodes being placed at
         # different heights so that the calculations are easier
 
         self.resolved = False  # used so that the arrows can be drawn at the correct times
+        self.solution_complete = False  # whether the newest solution had all the forces
+        # resolves the structure without freezing the window
+        self.solver = solver.BackgroundSolver(lambda: pygame.event.post(pygame.event.Event(SOLVED)))
+        self._requested_version = None  # the version of the model last sent to the solver
+        self.solution_method = None  # how the last solution was found ("truss" or "vertical")
+        self._solution_version = None  # the model version the last solution shown is for
+        self.utilisation = None  # how close each beam is to failing, from the last truss solution
+        self._utilisation_version = None  # the structure version the utilisation is for
+        self.error = None  # shown in the top bar when loading a structure fails
 
         self.nodes = []
         self.beams = []
         self.fixed = []
+        self._list_index = {}  # where each structure is in its list so it can be removed in O(1)
+        self.model = structure.Model()  # the arrays the nodes and beams are stored in
+        self.index = spatial.StructureIndex()  # for finding the structures near a point quickly
+        self.connectivity = physics.Connectivity()  # for checking if the structure is complete
+        self.moments = physics.MomentTracker()  # for showing the vertical forces as the structure is edited
+        self.file_path = file_path  # where the structure is saved to and loaded from
+        self.history = history.History()  # the edits that can be undone and redone
+        self.simulation = None  # the dynamic simulation while it is running
+        self._design_positions = None  # where the nodes are put back to when the simulation stops
+        self._simulation_lines = []  # the beams joined into lines of node indices for drawing the simulation
 
         self.selected = SELECTOR  # this is the selected mode chosen from the buttons
         self.selection_box_start = None  # the selections box requires a start position
         self.time_of_selection = 0  # initialising the variable used to determine whether it is a click or drag
-        self.selected_structures = []  # the selection tool can select multiple objects
+        self.selected_structures = set()  # the selection tool can select multiple objects
         self.dragging_selected = False  # this is so that the objects selected can be moved
+        self._drag_start = {}  # where the dragged nodes started so the whole drag is one edit
         self.selected_node = None  # this is used for the beam so that it can latch onto points
 
         self.grid_snapping = False  # for grid snapping
@@ -40,21 +83,42 @@ class App:
         pygame.init()
 
         self._window_size = window_size
+        self._centre = window_size[0]/2, window_size[1]/2
         self.canvas = pygame.display.set_mode(window_size)
         self.clock = pygame.time.Clock()
 
         self.bg_colour = (255, 255, 255)
-        select = button.Button(self.canvas, "Select", (10, 10), False, self.change_selection, SELECTOR)
-        point = button.Button(self.canvas, "Point", (160, 10), False, self.change_selection, POINT)
-        fixed = button.Button(self.canvas, "Fixed", (310, 10), False, self.change_selection, FIXED)
-        beam = button.Button(self.canvas, "Beam", (460, 10), False, self.change_selection, BEAM)
-        resolve = button.Button(self.canvas, "Resolve", (610, 10), False, self.resolve)
+        self.top_bar_height = 80
+        self.top_bar = pygame.Rect(0, 0, window_size[0], self.top_bar_height)
+        self.font = pygame.font.Font(None, 30)
+
+        # timing of each part of the frame, shown with F3 and saved with F4
+        self.profiler = profiler.Profiler()
+        self.profiler_font = pygame.font.Font(None, 22)
+        self.trace_path = "profile_trace.jsonl"
+        # the results are added to results_runs.csv, results_nodes.csv and results_beams.csv
+        self.results_path = "results.csv"
+
+        # the parts of the screen that rarely change are drawn onto their own surfaces and only
+        # redrawn when something they show changes (the keys store what they were drawn with)
+        self.grid_layer = pygame.Surface(window_size)
+        self.scene_layer = pygame.Surface(window_size)  # the grid with the structures on top
+        self.toolbar_layer = pygame.Surface(self.top_bar.size)
+        self._grid_key = None
+        self._scene_key = None
+        self._toolbar_key = None
+        self._overlay_rects = []  # the areas drawn over the layers last frame
+
+        # the buttons are drawn onto the toolbar layer (which is at the top left so the positions are the same)
+        select = button.Button(self.toolbar_layer, "Select", (10, 10), False, self.change_selection, SELECTOR)
+        point = button.Button(self.toolbar_layer, "Point", (160, 10), False, self.change_selection, POINT)
+        fixed = button.Button(self.toolbar_layer, "Fixed", (310, 10), False, self.change_selection, FIXED)
+        beam = button.Button(self.toolbar_layer, "Beam", (460, 10), False, self.change_selection, BEAM)
+        resolve = button.Button(self.toolbar_layer, "Resolve", (610, 10), True, self.resolve)
         def snap():
             self.grid_snapping = not self.grid_snapping
-        snapping = button.Button(self.canvas, "Grid", (800, 10), True, snap)
+        snapping = button.Button(self.toolbar_layer, "Grid", (800, 10), True, snap)
         self.buttons = [select, point, fixed, beam, resolve, snapping]
-        self.top_bar_height = 80
-        self.top_bar = pygame.Rect(0, 0, window_size[0], self.top_bar_height)
 
     def change_selection(self, selection):
         """Function for changing what is currently selected - used by the buttons."""
@@ -63,47 +127,178 @@ class App:
         self.selected = selection
 
     def draw(self):
-        """Draws anything that needs to be drawn to the screen"""
-        self.canvas.fill(self.bg_colour)
-        self.draw_grid()
-        self.draw_structures()
-
-        # draw any force arrows
-        if self.resolved:
-            for i in self.fixed:
-                draw.force_arrow(self.canvas, self.coords_to_pos(i.position), math.pi/2, i.vertical_force, self.scale)
-
-        # draw the top bar
-        pygame.draw.rect(self.canvas, (200, 200, 200), self.top_bar)
-        # draw the buttons
-        for button in self.buttons:
-            button.draw()
+        """Draws anything that needs to be drawn to the screen.
+        Returns the areas of the screen that have changed or None if all of it may have changed"""
+        full_redraw = False
+
+        # the grid only changes when panning or zooming
+        view = (self.screen_offset, self.scale)
+        if view != self._grid_key:
+            self._grid_key = view
+            with self.profiler.section("draw_grid"):
+                self.grid_layer.fill(self.bg_colour)
+                self.draw_grid(self.grid_layer)
+
+        # the structures also change when they are edited, selected or resolved
+        scene = (view, self.model.version, frozenset(self.selected_structures), self.resolved and self.solution_complete)
+        if scene != self._scene_key:
+            self._scene_key = scene
+            self.scene_layer.blit(self.grid_layer, (0, 0))
+            with self.profiler.section("draw_structures"):
+                self.draw_structures(self.scene_layer)
+            # draw any force arrows
+            if self.resolved and self.solution_complete:
+                for i in self.fixed:
+                    draw.force_arrow(self.scene_layer, self.coords_to_pos(i.position), math.pi/2, i.vertical_force, self.scale)
+                    if i.horizontal_force != 0:
+                        draw.force_arrow(self.scene_layer, self.coords_to_pos(i.position), 0, i.horizontal_force, self.scale)
+            full_redraw = True
+
+        # the top bar changes when the buttons are hovered over or clicked
+        complete = self.connectivity.complete()
+        # the vertical forces from the running totals are cheap enough to show every frame
+        reactions = self.moments.reactions(self.fixed) if complete else None
+        if reactions is not None:
+            reactions = tuple(round(i, 1) for i in reactions)
+        toolbar = (tuple((i.hovering(), i.clicking) for i in self.buttons), complete, reactions, self.error)
+        toolbar_changed = toolbar != self._toolbar_key
+        if toolbar_changed:
+            self._toolbar_key = toolbar
+            with self.profiler.section("buttons"):
+                # draw the top bar
+                self.toolbar_layer.fill((200, 200, 200))
+                # draw the buttons
+                for button in self.buttons:
+                    button.draw()
+            # show whether the structure can be resolved
+            status = self.font.render("Complete" if complete else "Incomplete", True,
+                                      (0, 128, 0) if complete else (128, 0, 0))
+            self.toolbar_layer.blit(status, (950, 35))
+            if reactions is not None:
+                text = self.font.render(f"Vertical forces: {reactions[0]}, {reactions[1]}", True, (0, 0, 0))
+                self.toolbar_layer.blit(text, (1100, 35))
+            if self.error is not None:
+                self.toolbar_layer.blit(self.font.render(self.error, True, (128, 0, 0)), (950, 10))
+
+        if full_redraw:
+            self.canvas.blit(self.scene_layer, (0, 0))
+            dirty = None
+        else:
+            # only cover up what was drawn over the layers last frame
+            for rect in self._overlay_rects:
+                self.canvas.blit(self.scene_layer, rect, rect)
+            dirty = self._overlay_rects + ([self.top_bar] if toolbar_changed else [])
+        self.canvas.blit(self.toolbar_layer, (0, 0))
+
         # draw the item being held
+        mouse = pygame.mouse.get_pos()
+        overlays = []
         if self.selected == POINT:
-            draw.node(self.canvas, pygame.mouse.get_pos())
+            overlays.append(draw.node(self.canvas, mouse))
         elif self.selected == FIXED:
-            draw.fixed(self.canvas, pygame.mouse.get_pos())
+            overlays.append(draw.fixed(self.canvas, mouse))
         elif self.selected == BEAM:
             if self.selected_node is None:
-                draw.beam_selector(self.canvas, pygame.mouse.get_pos())
+                overlays.append(draw.beam_selector(self.canvas, mouse))
             else:
-                draw.beam(self.canvas, self.coords_to_pos(self.selected_node.position),
-                          pygame.mouse.get_pos())
+                overlays.append(draw.beam(self.canvas, self.coords_to_pos(self.selected_node.position), mouse))
         elif self.selected == SELECTOR and self.selection_box_start is not None:
-            draw.selector_box(self.canvas, self.selection_box_start, pygame.mouse.get_pos())
-
-
+            overlays.append(draw.selector_box(self.canvas, self.selection_box_start, mouse))
+        if self.profiler.enabled:
+            overlays.append(self.profiler.draw(self.canvas, self.profiler_font, (self._window_size[0] - 10, self.top_bar_height + 10)))
+        self._overlay_rects = [i.clip(self.canvas.get_rect()) for i in overlays]
+        return None if dirty is None else dirty + overlays
 
     def resolve(self):
-        """Resolves the forces"""
-        if physics.check_complete(self.nodes, self.fixed, self.beams):
-            physics.calculate_fixed(self.nodes, self.fixed, self.beams)
-            self.resolved = True
-            print([i.vertical_force for i in self.fixed])
+        """Turns resolving the forces on or off. While it is on the structure is resolved
+        in the background whenever it changes"""
+        self.resolved = not self.resolved
+        self.solution_complete = False
+        self._requested_version = None
+
+    def export_results(self):
+        """Adds the structure and the forces from the last solution to the end of the results files"""
+        # the forces are only exported if they are from a solution of the structure as it is now
+        solved = self.resolved and self.solution_complete and self._solution_version == self.model.version
+        run = f"{self.file_path} {time.strftime('%Y-%m-%d %H:%M:%S')}"
+        tables = export.structure_tables(run, self.nodes, self.fixed, self.beams, self.file_path,
+                                         solved, self.solution_method if solved else "")
+        export.export(self.results_path, tables)
+
+    def start_simulation(self):
+        """Starts simulating how the structure moves under its own weight from where it is now"""
+        if self.dragging_selected:
+            self.end_drag()
+        nodes = self.nodes + self.fixed
+        self._design_positions = [i.index for i in nodes], [i.position[0] for i in nodes], [i.position[1] for i in nodes]
+        self.simulation = physics.Simulation(self.nodes, self.fixed, self.beams, SIMULATION_YOUNGS_MODULUS)
+        # the beams do not change while simulating so they only need joining into lines once
+        self._simulation_lines = draw.join_segments([(i.node1.index, i.node2.index) for i in self.model.beams])
+
+    def stop_simulation(self):
+        """Stops the simulation and puts the nodes back where they were before it started"""
+        if self.simulation is None:
+            return
+        self.simulation = None
+        self.model.set_positions(*self._design_positions)
+        self._design_positions = None
+
+    def update_simulation(self) -> bool:
+        """Moves the simulation on by the time since the last frame, returns True if anything moved"""
+        if self.simulation is None or self.simulation_settled():
+            return False
+        with self.profiler.section("simulate"):
+            # a long pause (such as dragging the window) should not make the simulation jump
+            substeps = self.simulation.step(min(self.clock.get_time() / 1000, 0.1))
+            self.profiler.count("substeps", substeps)
+            if substeps:
+                self.model.set_positions(self._design_positions[0], self.simulation.xs, self.simulation.ys)
+        return substeps > 0
+
+    def simulation_settled(self) -> bool:
+        return self.simulation.time > 0 and self.simulation.fastest_speed() < SETTLED_SPEED
+
+    def update_solution(self) -> bool:
+        """Sends the structure to the solver if it has changed and shows the newest solution.
+        Returns True if there was a new solution to show"""
+        if not self.resolved:
+            return False
+        with self.profiler.section("resolve"):
+            if self.model.version != self._requested_version:
+                self._requested_version = self.model.version
+                self.solver.request(self.model)
+
+            solution = self.solver.take_result()
+            # the solution can only be used if no structures have been added or removed since
+            if solution is not None and solution.structure_version == self.model.structure_version:
+                self.solution_complete = solution.complete
+                self.solution_method = solution.method
+                self._solution_version = solution.version
+                if not solution.complete:
+                    # the forces from an older solution do not apply any more
+                    for node in self.fixed:
+                        node.horizontal_force = node.vertical_force = 0
+                    for beam in self.beams:
+                        beam.force = 0
+                for index, (horizontal, vertical) in solution.reactions.items():
+                    node = self.model.nodes[index]
+                    node.horizontal_force, node.vertical_force = horizontal, vertical
+                for beam, force in zip(self.model.beams, solution.beam_forces):
+                    beam.force = force
+                # only a truss solution has the forces in the beams
+                if solution.method == "truss":
+                    with self.profiler.section("check members"):
+                        self.utilisation = physics.member_utilisation(self.model, solution.beam_forces)
+                    self._utilisation_version = solution.structure_version
+                else:
+                    self.utilisation = None
+                self._scene_key = None  # the force arrows need redrawing
+                return True
+        return False
 
     def pos_to_coords(self, pos: tuple) -> tuple:
         """Returns the coordinates of a point given its position on the screen"""
-        cx, cy = [i/2 for i in self._window_size]  # finding the centre x and y 
+        cx, cy = self._centre
         x, y = pos
         x = (x - cx - self.screen_offset[0])/self.scale  # working out the x position  
         y = (cy + self.screen_offset[1] - y)/self.scale  # y position works differently as y is flipped
@@ -111,25 +306,160 @@ class App:
 
     def coords_to_pos(self, coords: tuple) -> tuple:
         """Returns the position on the screen of a point given its coordinates"""
-        cx, cy = [i/2 for i in self._window_size]  # finding the centre x and y 
+        cx, cy = self._centre
         x, y = coords
         x = x*self.scale + cx + self.screen_offset[0]  # working out the x position 
         y = cy + self.screen_offset[1] - y*self.scale  # y position works differently as y is flipped
         return x, y
 
+    def transform(self) -> tuple:
+        """Returns the scale and offsets so that a position on the screen is
+        (x*scale + x_offset, y_offset - y*scale), so it only has to be worked out once per frame"""
+        cx, cy = self._centre
+        return self.scale, cx + self.screen_offset[0], cy + self.screen_offset[1]
+
+    def screen_positions(self, indices: list, transform: tuple) -> tuple:
+        """Returns the x and y positions on the screen of the nodes at the given indices of the model
+        all at once"""
+        scale, x_offset, y_offset = transform
+        if numpy is not None and indices:
+            indices = numpy.fromiter(indices, dtype=numpy.intp, count=len(indices))
+            xs = numpy.frombuffer(self.model.xs)[indices] * scale + x_offset
+            ys = y_offset - numpy.frombuffer(self.model.ys)[indices] * scale
+            return xs.tolist(), ys.tolist()
+        xs, ys = self.model.xs, self.model.ys
+        return [xs[i]*scale + x_offset for i in indices], [y_offset - ys[i]*scale for i in indices]
+
     def nearest_node(self, coords: tuple):
         """Returns the nearst nde or fixed node to a given point 
         (using its coordinates not its position on the screen)"""
-        x, y = coords
-        closest = None
-        distance = math.inf
-        for i in self.nodes + self.fixed:
-            x1, y1 = i.position  # extract the coordinates of the node
-            temp_distance = ((x1-x)**2 + (y1-y)**2)**(1/2)  # use pythagoras to find the distance
-            if temp_distance < distance:  # if this is closer than the previous closest
-                closest = i  # then put this as the closest
-                distance = temp_distance
-        return closest
+        return self.index.nodes.nearest(coords)
+
+    def _list_for(self, struc) -> list:
+        if isinstance(struc, structure.FixedNode):
+            return self.fixed
+        if isinstance(struc, structure.Node):
+            return self.nodes
+        return self.beams
+
+    def add_structure(self, struc):
+        """Adds a node, fixed node or beam to the structure"""
+        self.stop_simulation()  # the simulation only knows about the structure it started with
+        structures = self._list_for(struc)
+        self._list_index[struc] = len(structures)
+        structures.append(struc)
+        if isinstance(struc, structure.Node):
+            self.model.add_node(struc)
+            self.index.add_node(struc)
+            self.connectivity.add_node(struc)
+        else:
+            self.model.add_beam(struc)
+            self.index.add_beam(struc)
+            self.connectivity.add_beam(struc)
+            self.moments.add_beam(struc)
+
+    def save(self):
+        """Saves the structure to the file path"""
+        self.stop_simulation()  # the structure as it was designed is saved, not how it has moved
+        storage.save_structure(self.file_path, self.nodes, self.fixed, self.beams)
+
+    def load(self):
+        """Replaces the structure with the one saved at the file path,
+        if it cannot be read the structure is kept and the error is shown instead"""
+        try:
+            nodes, fixed, beams = storage.load_structure(self.file_path)
+        except Exception as error:
+            self.error = f"Could not load {self.file_path}: {error}"
+            return
+        self.error = None
+        self.stop_simulation()
+        # starting again is much quicker than removing the old structures one at a time
+        model = structure.Model()
+        # carrying on from the old versions so nothing made for the old structure is taken to be up to date
+        model.version = self.model.version + 1
+        model.structure_version = self.model.structure_version + 1
+        self.model = model
+        self.nodes, self.fixed, self.beams = [], [], []
+        self._list_index = {}
+        self.index = spatial.StructureIndex()
+        self.connectivity = physics.Connectivity()
+        self.moments = physics.MomentTracker()
+        for i in nodes + fixed + beams:
+            self.add_structure(i)
+        self.history.clear()
+        self.selected_structures = set()
+        self.selected_node = None
+        # nothing from solving the old structure applies to the new one
+        self.solution_complete = False
+        self.solution_method = None
+        self._solution_version = None
+        self._requested_version = None
+        self.utilisation = None
+        self._utilisation_version = None
+
+    def remove_structure(self, struc) -> list:
+        """Removes a node, fixed node or beam from the structure, for a node any beams joined to it
+        are removed as well. Returns everything that was removed (nothing if it was already removed)."""
+        if struc not in self._list_index:
+            return []
+        self.stop_simulation()
+        removed = []
+        if isinstance(struc, structure.Node):
+            # the adjacency in the model means only the joined beams are looked at
+            for beam in list(self.model.beams_of(struc)):
+                removed += self.remove_structure(beam)
+
+        # the last structure in the list is moved into the gap
+        structures = self._list_for(struc)
+        index = self._list_index.pop(struc)
+        last = structures.pop()
+        if last is not struc:
+            structures[index] = last
+            self._list_index[last] = index
+
+        if isinstance(struc, structure.Node):
+            self.index.remove_node(struc)
+            self.connectivity.remove_node(struc)
+            self.model.remove_node(struc)
+        else:
+            self.index.remove_beam(struc)
+            self.connectivity.remove_beam(struc)
+            self.moments.remove_beam(struc)
+            self.model.remove_beam(struc)
+        removed.append(struc)
+        return removed
+
+    def undo(self):
+        """Undoes the last edit to the structure"""
+        self.stop_simulation()
+        if self.history.undo(self):
+            self._edited()
+
+    def redo(self):
+        """Redoes the last edit that was undone"""
+        self.stop_simulation()
+        if self.history.redo(self):
+            self._edited()
+
+    def _edited(self):
+        # anything selected might not exist any more
+        self.selected_structures = {i for i in self.selected_structures if i in self._list_index}
+        if self.selected_node not in self._list_index:
+            self.selected_node = None
+
+    def start_drag(self):
+        """Remembers where the selected nodes are so that the drag can be undone"""
+        self.stop_simulation()
+        self.dragging_selected = True
+        self._drag_start = {i: i.position for i in self.selected_structures if isinstance(i, structure.Node)}
+
+    def end_drag(self):
+        """Records the drag as one edit using only where each node started and finished"""
+        self.dragging_selected = False
+        moves = {node: (start, node.position) for node, start in self._drag_start.items()
+                 if node.position != start}
+        self.history.record(history.MoveNodes(moves))
+        self._drag_start = {}
 
 
     def place(self):
@@ -140,14 +470,18 @@ class App:
             if self.grid_snapping:
                 x, y = coords
                 coords = round(x), round(y)
-            self.nodes.append(structure.Node(coords))
+            node = structure.Node(coords)
+            self.add_structure(node)
+            self.history.record(history.AddStructures([node]))
 
         elif self.selected == FIXED:
             if self.grid_snapping:
                 x, y = coords
                 coords = round(x), round(y)
             if len(self.fixed) < 2 or not self.locked_fixed:  # only allow 2 fixed nodes
-                self.fixed.append(structure.FixedNode(coords if not self.locked_fixed else (coords[0], 0)))
+                node = structure.FixedNode(coords if not self.locked_fixed else (coords[0], 0))
+                self.add_structure(node)
+                self.history.record(history.AddStructures([node]))
 
         elif self.selected == BEAM:
             nearest = self.nearest_node(coords)
@@ -159,38 +493,97 @@ class App:
             elif self.selected_node != nearest:
                 # adding the beam joining the 2 nodes
                 beam = structure.Beam(self.selected_node, nearest)
-                if not any([beam == i for i in self.beams]):  # disallowing duplicate beams
-                    self.beams.append(beam)
+                if not self.model.contains_beam(beam):  # disallowing duplicate beams
+                    self.add_structure(beam)
+                    self.history.record(history.AddStructures([beam]))
                 self.selected_node = None  # unselecting the first node
 
-    def draw_structures(self):
-        """Draws the currently placed structures onto the screen"""
-        # drawing the nodes
-        for i in self.nodes:
-            if i in self.selected_structures:
-                draw.node_selected(self.canvas, self.coords_to_pos(i.position))
-            else:
-                draw.node(self.canvas, self.coords_to_pos(i.position))
-        # drawing all the fixed nodes
-        for i in self.fixed:
-            if i in self.selected_structures:
-                draw.fixed_selected(self.canvas, self.coords_to_pos(i.position))
+    def visible_area(self, margin: float = 0) -> tuple:
+        """Returns the coordinates of the bottom left and top right of the screen,
+        made bigger by the margin (in pixels)"""
+        x1, y2 = self.pos_to_coords((-margin, -margin))
+        x2, y1 = self.pos_to_coords((self._window_size[0] + margin, self._window_size[1] + margin))
+        return x1, y1, x2, y2
+
+    def draw_structures(self, surface: pygame.Surface):
+        """Draws the currently placed structures that are on the screen onto the surface"""
+        transform = self.transform()
+        selected = self.selected_structures
+        # only the nodes that could overlap the screen are drawn (nodes are at most 12 pixels wide)
+        # (the index is not told about the simulation moving the nodes so then they are all looked at)
+        if self.simulation is None:
+            visible_nodes = self.index.nodes.query_box(*self.visible_area(12))
+        else:
+            visible_nodes = self.model.nodes
+        self.profiler.count("visible nodes", len(visible_nodes))
+        xs, ys = self.screen_positions([i.index for i in visible_nodes], transform)
+
+        # the nodes are drawn by copying pre drawn images of them all at once
+        # (when zoomed out a long way they are too small to see so only selected ones are drawn)
+        detailed = self.scale >= NODE_DETAIL_SCALE
+        sprites = {draw.node: [], draw.node_selected: [], draw.fixed: [], draw.fixed_selected: []}
+        for i, x, y in zip(visible_nodes, xs, ys):
+            if isinstance(i, structure.FixedNode):
+                sprites[draw.fixed_selected if selected and i in selected else draw.fixed].append((x, y))
+            elif selected and i in selected:
+                sprites[draw.node_selected].append((x, y))
+            elif detailed:
+                sprites[draw.node].append((x, y))
+        for function, positions in sprites.items():
+            draw.sprites(surface, function, positions)
+
+        if self.simulation is not None:
+            # every beam is drawn, joined into lines (by node) once when the simulation started
+            xs, ys = self.screen_positions(range(len(self.model.nodes)), transform)
+            draw.beam_lines(surface, [[(xs[i], ys[i]) for i in line] for line in self._simulation_lines])
+            draw.beam_lines(surface, [[(xs[i.node1.index], ys[i.node1.index]), (xs[i.node2.index], ys[i.node2.index])]
+                                      for i in selected if isinstance(i, structure.Beam)], True)
+            return
+
+        # drawing the beams that cross the screen
+        visible_beams = self.index.beams_crossing_box(*self.visible_area(5))
+        self.profiler.count("visible beams", len(visible_beams))
+        x1s, y1s = self.screen_positions([i.node1.index for i in visible_beams], transform)
+        x2s, y2s = self.screen_positions([i.node2.index for i in visible_beams], transform)
+        # once resolved the beams are coloured by how close they are to failing
+        utilisation = None
+        if self.resolved and self.utilisation is not None and self._utilisation_version == self.model.structure_version:
+            utilisation = self.utilisation
+        coloured = {}  # colour -> the beams of that colour
+        beams, selected_beams = [], []
+        dots = set()
+        for i, x1, y1, x2, y2 in zip(visible_beams, x1s, y1s, x2s, y2s):
+            if selected and i in selected:  # (hashing a beam is slow so it is avoided when nothing is selected)
+                selected_beams.append(((x1, y1), (x2, y2)))
+            elif abs(x1 - x2) < 1 and abs(y1 - y2) < 1:
+                # beams smaller than a pixel are merged into one dot per pixel
+                dots.add((int(x1), int(y1)))
+            elif utilisation is not None:
+                coloured.setdefault(draw.utilisation_colour(utilisation[i.index]), []).append(((x1, y1), (x2, y2)))
             else:
-                draw.fixed(self.canvas, self.coords_to_pos(i.position))
-        # drawing the beams
-        for i in self.beams:
-            if i in self.selected_structures:
-                draw.beam_selected(self.canvas, *map(self.coords_to_pos, i.ends))
-            else:
-                draw.beam(self.canvas, *map(self.coords_to_pos, i.ends))
-
-    def draw_grid(self):
-        """Draws the grid of coordinates on the screen"""
+                beams.append(((x1, y1), (x2, y2)))
+        # beams that join end to end are drawn as one line
+        draw.beam_lines(surface, draw.join_segments(beams))
+        for colour, segments in coloured.items():
+            draw.beam_lines(surface, draw.join_segments(segments), colour=colour)
+        draw.beam_lines(surface, draw.join_segments(selected_beams), True)
+        draw.beam_dots(surface, dots)
+
+    def draw_grid(self, surface: pygame.Surface):
+        """Draws the grid of coordinates onto the surface"""
         # check for out of range if so make the lines shorter
         xlen, ylen = self._window_size
         
-        # finding the closest coordinate to the corner
-        start = [int(math.ceil(i)) for i in self.pos_to_coords((0, 0))]
+        # when zoomed out only every 1, 2, 5, 10, 20, 50... lines are drawn so they are not too close
+        step = 1
+        multipliers = [2, 2.5, 2]
+        while step * self.scale < MIN_GRID_SPACING:
+            step *= multipliers[0]
+            multipliers.append(multipliers.pop(0))
+        spacing = step * self.scale
+
+        # finding the closest coordinate (that is a multiple of the step) to the corner
+        start = [int(math.ceil(i / step) * step) for i in self.pos_to_coords((0, 0))]
         #turning that coordinate into a position on the screen
         start = self.coords_to_pos(start)
 
@@ -198,15 +591,15 @@ class App:
         colour = (200, 200, 200)
         pos = start[0]
         # drawing the vertical lines
-        for i in range(self._window_size[0] // self.scale + 1):
-            pygame.draw.line(self.canvas, colour, (pos, 0), (pos, ylen))
-            pos += self.scale
+        for i in range(int(self._window_size[0] // spacing) + 1):
+            pygame.draw.line(surface, colour, (pos, 0), (pos, ylen))
+            pos += spacing
 
         pos = start[1]
         # drawing the horizontal lines
-        for i in range(self._window_size[1] // self.scale + 1):
-            pygame.draw.line(self.canvas, colour, (0, pos), (xlen, pos))
-            pos += self.scale
+        for i in range(int(self._window_size[1] // spacing) + 1):
+            pygame.draw.line(surface, colour, (0, pos), (xlen, pos))
+            pos += spacing
 
     def selector_released(self):
         """Handles what to do when the selection tool is released"""
@@ -216,13 +609,13 @@ class App:
 
                 # look for anything close enough if it was only a click
                 mouse = self.pos_to_coords(pygame.mouse.get_pos())
-                nearest = structure.nearest_structure(self.nodes + self.fixed + self.beams, mouse)
+                nearest = self.index.nearest(mouse)
 
                 if nearest is not None:  # nearest is none when there are no structures on the screen
                     if structure.distance_from(nearest, mouse) * self.scale < 50:
-                        self.selected_structures = [nearest]
+                        self.selected_structures = {nearest}
                     else:  # not clicked close enough, reset selected 
-                        self.selected_structures = []
+                        self.selected_structures = set()
 
 
             # The click was slower so assuming it was a box select
@@ -233,15 +626,8 @@ class App:
                 x1, x2 = min(x1, x2), max(x1, x2)
                 y1, y2 = min(y1, y2), max(y1, y2)
 
-                # looping over the structures and checking if they are in the box
-                for i in self.nodes + self.fixed:
-                    x, y = i.position
-                    if x1 < x < x2 and y1 < y < y2:
-                        self.selected_structures.append(i)
-                for i in self.beams:
-                    x, y = i.centre
-                    if x1 < x < x2 and y1 < y < y2:
-                        self.selected_structures.append(i)
+                # finding the structures in the box
+                self.selected_structures.update(self.index.query_box(x1, y1, x2, y2))
 
 
         # reset selection box
@@ -252,29 +638,48 @@ class App:
 
 
 
-    def handle_events(self):
-        """Deals with any events such as keys or clicks"""
-        for event in pygame.event.get():
+    def handle_events(self, events: list = None):
+        """Deals with any events such as keys or clicks (takes the events from pygame if none are given)"""
+        for event in pygame.event.get() if events is None else events:
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
 
             if event.type == pygame.KEYDOWN:
+                # showing the profiler and saving what it has recorded
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle()
+                elif event.key == pygame.K_F4:
+                    self.profiler.dump(self.trace_path)
+                elif event.key == pygame.K_F5:
+                    if self.simulation is None:
+                        self.start_simulation()
+                    else:
+                        self.stop_simulation()
+                # saving and loading the structure
+                if event.key == pygame.K_s and event.mod & pygame.KMOD_CTRL:
+                    self.save()
+                elif event.key == pygame.K_o and event.mod & pygame.KMOD_CTRL and os.path.exists(self.file_path):
+                    self.load()
+                elif event.key == pygame.K_e and event.mod & pygame.KMOD_CTRL:
+                    self.export_results()
+                # undoing and redoing (ctrl+shift+z also redoes)
+                elif event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL and not self.dragging_selected:
+                    if event.mod & pygame.KMOD_SHIFT:
+                        self.redo()
+                    else:
+                        self.undo()
+                elif event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL and not self.dragging_selected:
+                    self.redo()
                 # delete all of the selected items
                 if event.key == pygame.K_DELETE:
+                    # (removing a node also removes any connected beams)
+                    removed = []
                     for i in self.selected_structures:
-                        # remove any connected beams
-                        if isinstance(i, structure.Node):
-                            for beam in self.beams:
-                                if i is beam.node1 or i is beam.node2:
-                                    self.beams.remove(beam)
-                        # remove the selected object
-                        if i in self.fixed:
-                            self.fixed.remove(i)
-                        elif i in self.nodes:
-                            self.nodes.remove(i)
-                        elif i in self.beams:
-                            self.beams.remove(i)
+                        removed += self.remove_structure(i)
+                    self.history.record(history.RemoveStructures(removed))
+                    self.selected_structures = set()
+                    self.selected_node = None
 
             if event.type == pygame.MOUSEBUTTONUP:
                 if event.button == 1:  # left mouse button
@@ -286,7 +691,7 @@ class App:
                     if self.selected == SELECTOR:
                         # stop moving the selected structures if dragging them
                         if self.dragging_selected:
-                            self.dragging_selected = False
+                            self.end_drag()
                         # select the things that need to be selected
                         elif pygame.mouse.get_pos()[1] > self.top_bar_height:
                             self.selector_released()
@@ -304,17 +709,17 @@ class App:
                     if pygame.mouse.get_pos()[1] > self.top_bar_height:
                         self.place()
                         if self.selected == SELECTOR:
-                            if self.selected_structures == []:
+                            if not self.selected_structures:
                                 self.time_of_selection = time.time()
                                 self.selection_box_start = pygame.mouse.get_pos()
                             else:
                                 dist_from_mouse = lambda x: structure.distance_from(x, self.pos_to_coords(pygame.mouse.get_pos()))
                                 distance = min(map(dist_from_mouse, self.selected_structures))
                                 if distance * self.scale < 100:
-                                    self.dragging_selected = True
+                                    self.start_drag()
                                     self.last_mouse_position = pygame.mouse.get_pos()
                                 else:
-                                    self.selected_structures = []
+                                    self.selected_structures = set()
                                     self.time_of_selection = time.time()
                                     self.selection_box_start = pygame.mouse.get_pos()
 
@@ -352,20 +757,55 @@ class App:
                 if isinstance(i, structure.Beam):
                     continue  # do not move if it is a beam
                 xpos, ypos = i.position
-                if i in self.fixed and self.locked_fixed:  # don't change the y of the fixed nodes if locked
+                if isinstance(i, structure.FixedNode) and self.locked_fixed:  # don't change the y of the fixed nodes if locked
                     i.position = xpos + xoff, 0
                 else:
                     i.position = xpos + xoff, ypos + yoff
             # reset the last mouse position
             self.last_mouse_position = pygame.mouse.get_pos()
 
+    def animating(self) -> bool:
+        """Returns True while something is moving on the screen without any events happening
+        (panning, dragging, the selection box or the held item following the mouse)"""
+        if self.simulation is not None and not self.simulation_settled():
+            return True
+        return self.dragging or self.dragging_selected or self.selection_box_start is not None
+
+    def wait_for_events(self) -> list:
+        """Returns the events that have happened. While nothing is moving this waits
+        for an event (rather than redrawing 60 times a second) so an idle window uses no CPU."""
+        if self.animating():
+            self.clock.tick(60)
+            return pygame.event.get()
+        event = pygame.event.wait(IDLE_TIMEOUT)
+        if event.type == pygame.NOEVENT:
+            return []
+        self.clock.tick()  # stops the next fixed tick waiting for the time spent idle
+        return [event] + pygame.event.get()
+
     def mainloop(self):
         """Mainloop of the program"""
+        first_frame = True
         while True:
-            self.handle_events()
-            self.draw()
-            pygame.display.update()
-            self.clock.tick(60)
+            events = [] if first_frame else self.wait_for_events()
+            with self.profiler.section("handle_events"):
+                self.handle_events(events)
+            simulated = self.update_simulation()
+            solved = self.update_solution()
+            # nothing on the screen can have changed without an event, a new solution or the simulation
+            if not (events or solved or simulated or self.animating() or first_frame):
+                continue
+            first_frame = False
+            dirty = self.draw()
+            with self.profiler.section("display_update"):
+                if dirty is None:
+                    pygame.display.update()
+                else:
+                    pygame.display.update(dirty)
+            self.profiler.count("nodes", len(self.nodes) + len(self.fixed))
+            self.profiler.count("beams", len(self.beams))
+            self.profiler.count("updated areas", "all" if dirty is None else len(dirty))
+            self.profiler.end_frame()
 
     def main_menu(self):
         """Runs the main menu of the program - the text is in an image as that is the easiest solution"""
@@ -383,7 +823,8 @@ class App:
         image = pygame.image.load("Description.png")
 
         while True:
-            for event in pygame.event.get():
+            # the menu only changes when the mouse moves or clicks so it waits for events
+            for event in [pygame.event.wait()] + pygame.event.get():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     sys.exit()
@@ -395,7 +836,6 @@ class App:
             start.draw()
             self.canvas.blit(image, (0, 70))
             pygame.display.update()
-            self.clock.tick(60)
 
 
 
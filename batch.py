@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import export
+import physics
+import storage
+
+STRUCTURE_EXTENSIONS = (".json", storage.BINARY_EXTENSION, storage.LINES_EXTENSION)
+
+
+def analyse(path: str, tables: bool = False):
+    """Loads and resolves a single structure file and returns the results as a dictionary.
+    If tables is True the results are also returned as tables for exporting (None if it did not load)."""
+    start = time.perf_counter()
+    result = {"file": path}
+    try:
+        nodes, fixed, beams = storage.load_structure(path)
+    except Exception as error:
+        result["error"] = f"Could not load the structure ({error})"
+        return (result, None) if tables else result
+
+    result["nodes"] = len(nodes) + len(fixed)
+    result["beams"] = len(beams)
+    result["mass"] = sum(i.mass for i in beams)
+    result["complete"] = physics.check_complete(nodes, fixed, beams)
+    if result["complete"]:
+        try:
+            physics.solve_truss(nodes, fixed, beams)
+            result["method"] = "truss"
+            result["beam_forces"] = [i.force for i in beams]
+        except Exception:
+            # not a stable truss so only the vertical forces can be found
+            try:
+                physics.calculate_fixed(nodes, fixed, beams)
+                result["method"] = "vertical"
+            except Exception as error:
+                result["error"] = str(error)
+        result["reactions"] = [[i.horizontal_force, i.vertical_force] for i in fixed]
+    result["time"] = time.perf_counter() - start
+    if tables:
+        return result, export.structure_tables(path, nodes, fixed, beams, path, result["complete"],
+                                               result.get("method", ""), result["time"])
+    return result
+
+
+def analyse_tables(path: str) -> tuple:
+    return analyse(path, True)
+
+
+def find_files(paths: list) -> list:
+    """Expands any directories into the structure files inside them"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.endswith(STRUCTURE_EXTENSIONS))
+        else:
+            files.append(path)
+    return files
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Resolve many structure files in parallel without the GUI")
+    parser.add_argument("paths", nargs="+", help="structure files or directories containing them")
+    parser.add_argument("-o", "--output", help="file to write the results to (one json object per line)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of processes (default all cores)")
+    parser.add_argument("-e", "--export", help="also add the node and beam results to this .npz file "
+                                               "(or csv files if it ends in .csv)")
+    args = parser.parse_args(args)
+
+    files = find_files(args.paths)
+    output = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    all_tables = []
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            # sending the files in chunks keeps the overhead down when there are lots of small ones
+            chunksize = max(1, len(files) // (4 * (args.workers or os.cpu_count() or 1)))
+            for result in pool.map(analyse_tables if args.export else analyse, files, chunksize=chunksize):
+                if args.export:
+                    result, tables = result
+                    if tables is not None:
+                        all_tables.append(tables)
+                output.write(json.dumps(result) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.export:
+        # every structure is written together at the end rather than a row at a time
+        export.export(args.export, export.merge(all_tables))
+    print(f"Resolved {len(files)} structures in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # so App can be drawn without a window
+
+import generate
+import matrix_maths
+import physics
+import structure
+
+SIZES = [10, 100, 1000, 10000, 100000]
+# the dense solver is O(n^3) so it is only run up to this many unknowns
+MAX_DENSE_SIZE = 300
+# a random structure has no band structure so its envelope (and the truss solve) grows as the square
+# of the size, it is only solved up to this many beams
+MAX_RANDOM_TRUSS_SIZE = 300
+# the linear scan is only timed with a few points so the big sizes do not take forever
+NEAREST_QUERIES = 20
+
+
+def best_time(function, repeat: int) -> float:
+    """Returns the fastest time (in seconds) of running the function"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def dense_system(size: int, seed: int = 0) -> tuple:
+    """Makes a random diagonally dominant (so never singular) system of equations"""
+    generator = random.Random(seed)
+    equations = [[generator.uniform(-1, 1) for _ in range(size)] for _ in range(size)]
+    for i, row in enumerate(equations):
+        row[i] += size
+    return equations, [generator.uniform(-1, 1) for _ in range(size)]
+
+
+def make_app(nodes: list, fixed: list, beams: list):
+    import app
+    application = app.App((1800, 1000))
+    for i in nodes + fixed + beams:
+        application.add_structure(i)
+    # zoomed out so the whole structure is on the screen
+    x_values = [i.position[0] for i in fixed]
+    application.scale = max(1, int(1600 / max(1, max(x_values) - min(x_values))))
+    application.screen_offset = (-application.scale * sum(x_values) / 2, 0)
+    return application
+
+
+def run(sizes: list, patterns: list, repeat: int, include_app: bool) -> list:
+    results = []
+
+    def record(benchmark, pattern, size, function, per=1):
+        try:
+            seconds = best_time(function, repeat) / per
+        except Exception as error:
+            results.append({"benchmark": benchmark, "pattern": pattern, "size": size, "error": str(error)})
+        else:
+            results.append({"benchmark": benchmark, "pattern": pattern, "size": size, "seconds": seconds})
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    for size in sizes:
+        if size <= MAX_DENSE_SIZE:
+            equations, solutions = dense_system(size)
+            record("solve_simultaneous", "dense", size, lambda: matrix_maths.solve_simultaneous(equations, solutions))
+
+        for pattern in patterns:
+            nodes, fixed, beams = generate.PATTERNS[pattern](size)
+            size_name = len(beams)
+            # the query points are spread over the structure and a little way around it
+            xs = [i.position[0] for i in nodes + fixed]
+            ys = [i.position[1] for i in nodes + fixed]
+            generator = random.Random(size)
+            points = [(generator.uniform(min(xs) - 10, max(xs) + 10), generator.uniform(min(ys) - 10, max(ys) + 10))
+                      for _ in range(NEAREST_QUERIES)]
+
+            record("check_complete", pattern, size_name, lambda: physics.check_complete(nodes, fixed, beams))
+            record("calculate_fixed", pattern, size_name, lambda: physics.calculate_fixed(nodes, fixed, beams))
+            if pattern != "random" or size_name <= MAX_RANDOM_TRUSS_SIZE:
+                record("solve_truss", pattern, size_name, lambda: physics.solve_truss(nodes, fixed, beams))
+            every = nodes + fixed + beams
+            record("nearest_structure", pattern, size_name,
+                   lambda: [structure.nearest_structure(every, i) for i in points], NEAREST_QUERIES)
+
+            if include_app:
+                application = make_app(nodes, fixed, beams)
+                record("App.nearest_node", pattern, size_name,
+                       lambda: [application.nearest_node(i) for i in points], NEAREST_QUERIES)
+
+                def frame():
+                    application._grid_key = application._scene_key = application._toolbar_key = None
+                    application.draw()
+                record("App.draw", pattern, size_name, frame)
+    return results
+
+
+def compare(results: list, baseline: list, threshold: float) -> list:
+    """Returns the results that are slower than the baseline by more than the threshold (a ratio)"""
+    old = {(i["benchmark"], i["pattern"], i["size"]): i.get("seconds") for i in baseline}
+    regressions = []
+    for result in results:
+        before = old.get((result["benchmark"], result["pattern"], result["size"]))
+        if before and result.get("seconds") and result["seconds"] / before > threshold:
+            regressions.append(dict(result, baseline=before, ratio=result["seconds"] / before))
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Times the solver, topology checks and rendering on generated bridges")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of beams to generate")
+    parser.add_argument("--patterns", nargs="+", default=list(generate.PATTERNS), choices=list(generate.PATTERNS))
+    parser.add_argument("--repeat", type=int, default=3, help="the best of this many runs is recorded")
+    parser.add_argument("--no-app", action="store_true", help="skip the benchmarks that need pygame")
+    parser.add_argument("-o", "--output", help="file to write the json results to (default stdout)")
+    parser.add_argument("--compare", help="json results of an earlier run to check for regressions against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio counted as a regression")
+    args = parser.parse_args(args)
+
+    results = run(args.sizes, args.patterns, args.repeat, not args.no_app)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as file:
+            report["regressions"] = compare(results, json.load(file)["results"], args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+    if report.get("regressions"):
+        print(f"{len(report['regressions'])} regressions found", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
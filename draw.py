@@ -2,65 +2,147 @@ import pygame
 import math
 
 
-def node(canvas: pygame.Surface, position: tuple) -> None:
+def node(canvas: pygame.Surface, position: tuple) -> pygame.Rect:
     """Draws a node onto the screen at the given position on the screen"""
-    pygame.draw.circle(canvas, (50, 50, 50), position, 10)
+    return pygame.draw.circle(canvas, (50, 50, 50), position, 10)
 
 
-def node_selected(canvas: pygame.Surface, position: tuple) -> None:
+def node_selected(canvas: pygame.Surface, position: tuple) -> pygame.Rect:
     """Draws a node onto the screen at the given position on the screen 
     with a blue background behind to indicate it has been selected"""
-    pygame.draw.circle(canvas, (0, 0, 255), position, 12)
+    rect = pygame.draw.circle(canvas, (0, 0, 255), position, 12)
     pygame.draw.circle(canvas, (50, 50, 50), position, 10)
+    return rect
 
 
-def fixed(canvas: pygame.Surface, position: tuple) -> None:
+def fixed(canvas: pygame.Surface, position: tuple) -> pygame.Rect:
     """Draws a fixed node onto the screen at the given position on the screen"""
-    pygame.draw.circle(canvas, (50, 50, 50), position, 10)
+    rect = pygame.draw.circle(canvas, (50, 50, 50), position, 10)
     pygame.draw.circle(canvas, (255, 255, 255), position, 5)
+    return rect
 
 
-def fixed_selected(canvas: pygame.Surface, position: tuple) -> None:
+def fixed_selected(canvas: pygame.Surface, position: tuple) -> pygame.Rect:
     """Draws a fixed node onto the screen at the given position on the screen 
     with a blue background behind to indicate it has been selected"""
-    pygame.draw.circle(canvas, (0, 0, 255), position, 12)
+    rect = pygame.draw.circle(canvas, (0, 0, 255), position, 12)
     pygame.draw.circle(canvas, (50, 50, 50), position, 10)
     pygame.draw.circle(canvas, (255, 255, 255), position, 5)
+    return rect
+
+
+UTILISATION_BANDS = 10  # the utilisation colours are in bands so beams of the same colour can be drawn together
+
 
+def utilisation_colour(utilisation: float) -> tuple:
+    """The colour of a beam by how close it is to failing, from green (no force)
+    through yellow to red (at its limit). Beams that have failed are black."""
+    if utilisation >= 1:
+        return 0, 0, 0
+    band = int(utilisation * UTILISATION_BANDS) / UTILISATION_BANDS
+    if band < 0.5:
+        return int(510 * band), 200, 0
+    return 255, int(400 * (1 - band)), 0
 
-def beam(canvas: pygame.Surface, pos1: tuple, pos2: tuple) -> None:
+
+def beam(canvas: pygame.Surface, pos1: tuple, pos2: tuple, utilisation: float = None) -> pygame.Rect:
     """Draws a line representing a beam between the 2 given points 
-    onto the screen at the given position"""
-    colour = (255, 0, 0)
-    pygame.draw.line(canvas, colour, pos1, pos2, 3)
+    onto the screen at the given position, coloured by its utilisation if it is given"""
+    colour = (255, 0, 0) if utilisation is None else utilisation_colour(utilisation)
+    return pygame.draw.line(canvas, colour, pos1, pos2, 3)
 
-def beam_selected(canvas: pygame.Surface, pos1: tuple, pos2: tuple) -> None:
+def beam_selected(canvas: pygame.Surface, pos1: tuple, pos2: tuple) -> pygame.Rect:
     """Draws a line representing a beam between the 2 given points
     onto the screen at the given position with a blue background
     behind to indicate it has been selected"""
     selected_colour = (0, 0, 255)
     colour = (255, 0, 0)
-    pygame.draw.line(canvas, selected_colour, pos1, pos2, 5)
+    rect = pygame.draw.line(canvas, selected_colour, pos1, pos2, 5)
     pygame.draw.line(canvas, colour, pos1, pos2, 3)
+    return rect
+
+def join_segments(segments: list) -> list:
+    """Joins line segments that share ends into lines so that they can be drawn together.
+    Takes a list of pairs of points and returns a list of lists of points."""
+    ends = {}  # point -> indices of the segments that end there
+    for i, (start, end) in enumerate(segments):
+        ends.setdefault(start, []).append(i)
+        ends.setdefault(end, []).append(i)
+
+    used = [False] * len(segments)
+    lines = []
+    for i, (start, end) in enumerate(segments):
+        if used[i]:
+            continue
+        used[i] = True
+        line = [start, end]
+        # keep following unused segments from the end of the line
+        while True:
+            # used segments are popped off as they are found so each one is only looked at once
+            candidates = ends[line[-1]]
+            while candidates and used[candidates[-1]]:
+                candidates.pop()
+            if not candidates:
+                break
+            following = candidates.pop()
+            used[following] = True
+            a, b = segments[following]
+            line.append(b if a == line[-1] else a)
+        lines.append(line)
+    return lines
+
+
+def beam_lines(canvas: pygame.Surface, lines: list, selected: bool = False, colour: tuple = (255, 0, 0)) -> None:
+    """Draws lines of beams joined end to end, each line is a list of the points along it"""
+    selected_colour = (0, 0, 255)
+    for points in lines:
+        if selected:
+            pygame.draw.lines(canvas, selected_colour, False, points, 5)
+        pygame.draw.lines(canvas, colour, False, points, 3)
+
+
+_sprites = {}
+
+
+def sprites(canvas: pygame.Surface, function, positions: list) -> None:
+    """Draws lots of the same thing (e.g. node) at the given positions by drawing it once
+    and copying it onto the canvas at each position"""
+    if not positions:
+        return
+    if function not in _sprites:
+        size = 26  # big enough for the largest node
+        sprite = pygame.Surface((size, size), pygame.SRCALPHA)
+        function(sprite, (size/2, size/2))
+        _sprites[function] = sprite, size/2
+    sprite, offset = _sprites[function]
+    canvas.blits([(sprite, (x - offset, y - offset)) for x, y in positions], False)
+
+
+def beam_dots(canvas: pygame.Surface, positions: set) -> None:
+    """Draws beams that are shorter than a pixel as single pixels"""
+    colour = (255, 0, 0)
+    for position in positions:
+        canvas.set_at(position, colour)
+
 
-def beam_selector(canvas: pygame.Surface, position: tuple) -> None:
+def beam_selector(canvas: pygame.Surface, position: tuple) -> pygame.Rect:
     """Draws the icon to show that the beam is currently selected at the 
     given position"""
     colour = (255, 0, 0)
-    pygame.draw.circle(canvas, colour, position, 4)
+    return pygame.draw.circle(canvas, colour, position, 4)
 
 
-def selector_box(canvas: pygame.Surface, pos1: tuple, pos2: tuple):
+def selector_box(canvas: pygame.Surface, pos1: tuple, pos2: tuple) -> pygame.Rect:
     """Draws the blue box that appears while dragging the selector"""
     x1, y1 = pos1
     x2, y2 = pos2
     surf = pygame.Surface((abs(x1 - x2), abs(y1 - y2)))
     surf.set_alpha(64)
     surf.fill((0, 0, 255))
-    canvas.blit(surf, (min(x1, x2), min(y1, y2)))
+    return canvas.blit(surf, (min(x1, x2), min(y1, y2)))
 
 
-def force_arrow(canvas: pygame.Surface, position: tuple, angle: float, force: float, scale: int):
+def force_arrow(canvas: pygame.Surface, position: tuple, angle: float, force: float, scale: int) -> pygame.Rect:
     """Draws a force arrow at the given point - angle given in radians and position as position on the screen"""
     x, y = position  # unpack the position for ease of use
     arrowscale = 50  # scale o the arrow
@@ -73,5 +155,5 @@ def force_arrow(canvas: pygame.Surface, position: tuple, angle: float, force: fl
           - (math.cos(angle) * scale * ahs)/arrowscale + ty
     t2 = - (- math.sin(angle) * scale * ahs) / arrowscale + tx, \
          (math.cos(angle) * scale * ahs) / arrowscale + ty
-    pygame.draw.line(canvas, (0, 255, 0), position, end, 5)
-    pygame.draw.polygon(canvas, (0, 255, 0), (end, t1, t2))
\ No newline at end of file
+    rect = pygame.draw.line(canvas, (0, 255, 0), position, end, 5)
+    return rect.union(pygame.draw.polygon(canvas, (0, 255, 0), (end, t1, t2)))
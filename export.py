@@ -0,0 +1,157 @@
+import array
+import ast
+import csv
+import io
+import os
+import struct
+import sys
+import time
+import zipfile
+
+# The results are stored as tables of columns (column name -> array of numbers or list of strings):
+#   runs  - one row for each structure exported
+#   nodes - one row for each node with its position and the reaction if it is fixed
+#   beams - one row for each beam with the nodes it joins (indexing the nodes of the same run), its geometry and force
+RUN_COLUMNS = {"run": str, "file": str, "time": "d", "nodes": "q", "beams": "q", "mass": "d",
+               "complete": "B", "method": str, "solve_time": "d"}
+NODE_COLUMNS = {"run": str, "node": "q", "x": "d", "y": "d", "fixed": "B",
+                "horizontal_force": "d", "vertical_force": "d"}
+BEAM_COLUMNS = {"run": str, "beam": "q", "node1": "q", "node2": "q", "length": "d", "mass": "d", "force": "d"}
+TABLES = {"runs": RUN_COLUMNS, "nodes": NODE_COLUMNS, "beams": BEAM_COLUMNS}
+
+NPY_TYPES = {"d": "<f8", "q": "<i8", "B": "|u1"}  # array typecode -> numpy type
+
+
+def empty_tables() -> dict:
+    return {name: {column: [] if kind is str else array.array(kind) for column, kind in columns.items()}
+            for name, columns in TABLES.items()}
+
+
+def structure_tables(run: str, nodes: list, fixed: list, beams: list, file: str = "", complete: bool = False,
+                     method: str = "", solve_time: float = 0) -> dict:
+    """Makes the tables for one structure using the forces already set on its beams and fixed nodes,
+    the forces are written as 0 unless the structure was completely solved"""
+    every_node = nodes + fixed
+    index = {node: i for i, node in enumerate(every_node)}
+    tables = empty_tables()
+
+    runs = tables["runs"]
+    for column, value in (("run", run), ("file", file), ("time", time.time()), ("nodes", len(every_node)),
+                          ("beams", len(beams)), ("mass", sum(i.mass for i in beams)), ("complete", complete),
+                          ("method", method or ""), ("solve_time", solve_time)):
+        runs[column].append(value)
+
+    table = tables["nodes"]
+    table["run"] = [run] * len(every_node)
+    table["node"] = array.array("q", range(len(every_node)))
+    table["x"] = array.array("d", [i.position[0] for i in every_node])
+    table["y"] = array.array("d", [i.position[1] for i in every_node])
+    table["fixed"] = array.array("B", bytes(len(nodes))) + array.array("B", [1]) * len(fixed)
+    # only the fixed nodes have reactions
+    no_forces = array.array("d", bytes(8 * len(nodes)))
+    if complete:
+        table["horizontal_force"] = no_forces + array.array("d", [i.horizontal_force for i in fixed])
+        table["vertical_force"] = no_forces + array.array("d", [i.vertical_force for i in fixed])
+    else:
+        table["horizontal_force"] = array.array("d", bytes(8 * len(every_node)))
+        table["vertical_force"] = array.array("d", bytes(8 * len(every_node)))
+
+    table = tables["beams"]
+    table["run"] = [run] * len(beams)
+    table["beam"] = array.array("q", range(len(beams)))
+    table["node1"] = array.array("q", [index[i.node1] for i in beams])
+    table["node2"] = array.array("q", [index[i.node2] for i in beams])
+    table["length"] = array.array("d", [i.length for i in beams])
+    table["mass"] = array.array("d", [i.mass for i in beams])
+    table["force"] = array.array("d", [i.force for i in beams] if complete else bytes(8 * len(beams)))
+    return tables
+
+
+def merge(all_tables) -> dict:
+    """Joins the tables of many structures into one set of tables"""
+    merged = empty_tables()
+    for tables in all_tables:
+        for name, table in tables.items():
+            for column, values in table.items():
+                merged[name][column].extend(values)
+    return merged
+
+
+def write_csv(path: str, table: dict, append: bool = True):
+    """Writes the table as a csv file in one go, adding to the end of the file if it already exists"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if not (append and os.path.exists(path) and os.path.getsize(path)):
+        writer.writerow(table)
+    writer.writerows(zip(*table.values()))
+    with open(path, "a" if append else "w", newline="") as file:
+        file.write(buffer.getvalue())
+
+
+def npy_bytes(values) -> bytes:
+    """Turns a column into the bytes of a .npy file (so numpy is not needed to write them)"""
+    if isinstance(values, array.array):
+        descr = NPY_TYPES[values.typecode]
+        values = array.array(values.typecode, values)
+        if values.itemsize > 1 and sys.byteorder != "little":
+            values.byteswap()  # the columns are written little endian
+        data = values.tobytes()
+    else:
+        # strings are stored as fixed width utf-32 like numpy does
+        width = max((len(i) for i in values), default=1) or 1
+        descr = f"<U{width}"
+        data = "".join(i.ljust(width, "\0") for i in values).encode("utf-32-le")
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(values)},), }}"
+    # the header is padded so the data starts on a multiple of 64 bytes
+    header = header.ljust(64 * ((10 + len(header)) // 64 + 1) - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1") + data
+
+
+def read_npy(data: bytes):
+    """Reads the bytes of a .npy file written by npy_bytes back into an array or list of strings"""
+    if data[:8] != b"\x93NUMPY\x01\x00":
+        raise Exception("The column is not a .npy file")
+    length, = struct.unpack_from("<H", data, 8)
+    header = ast.literal_eval(data[10:10 + length].decode("latin1"))
+    values = data[10 + length:]
+    descr = header["descr"]
+    if descr.startswith("<U"):
+        width = int(descr[2:])
+        text = values.decode("utf-32-le")
+        return [text[i:i + width].rstrip("\0") for i in range(0, len(text), width)]
+    typecode = next(code for code, npy in NPY_TYPES.items() if npy == descr)
+    column = array.array(typecode, values)
+    if column.itemsize > 1 and sys.byteorder != "little":
+        column.byteswap()
+    return column
+
+
+def write_npz(path: str, tables: dict, append: bool = True):
+    """Writes the tables as a .npz file (a zip of .npy files) which numpy.load can open. Each write is
+    added as a new chunk of columns named <chunk>/<table>/<column> so appending never rewrites the file"""
+    mode = "a" if append and os.path.exists(path) else "w"
+    with zipfile.ZipFile(path, mode) as file:
+        chunk = sum(1 for i in file.namelist() if i.endswith("/runs/run.npy"))
+        for name, table in tables.items():
+            for column, values in table.items():
+                file.writestr(f"{chunk}/{name}/{column}.npy", npy_bytes(values))
+
+
+def read_npz(path: str) -> dict:
+    """Reads every chunk of a .npz file written by write_npz and joins them into one set of tables"""
+    chunks = {}
+    with zipfile.ZipFile(path) as file:
+        for member in file.namelist():
+            chunk, name, column = member[:-len(".npy")].split("/")
+            chunks.setdefault(int(chunk), {}).setdefault(name, {})[column] = read_npy(file.read(member))
+    return merge(chunks[i] for i in sorted(chunks))
+
+
+def export(path: str, tables: dict, append: bool = True):
+    """Writes the tables to a .npz file, or to a csv file for each table (path_runs.csv, path_nodes.csv...)"""
+    if path.endswith(".npz"):
+        write_npz(path, tables, append)
+        return
+    stem = os.path.splitext(path)[0]
+    for name, table in tables.items():
+        write_csv(f"{stem}_{name}.csv", table, append)
@@ -0,0 +1,70 @@
+import random
+import structure
+
+
+def warren_truss(panels: int, panel_width: float = 1, height: float = 1) -> tuple:
+    """Makes a Warren truss (equilateral triangles) with the given number of panels.
+    Returns the nodes, fixed nodes and beams (4 * panels - 1 beams)"""
+    bottom = [structure.Node((i * panel_width, 0)) for i in range(1, panels)]
+    fixed = [structure.FixedNode((0, 0)), structure.FixedNode((panels * panel_width, 0))]
+    bottom = [fixed[0]] + bottom + [fixed[1]]
+    top = [structure.Node(((i + 0.5) * panel_width, height)) for i in range(panels)]
+
+    beams = [structure.Beam(a, b) for a, b in zip(bottom, bottom[1:])]  # bottom chord
+    beams += [structure.Beam(a, b) for a, b in zip(top, top[1:])]  # top chord
+    for i, node in enumerate(top):  # diagonals going up and down
+        beams.append(structure.Beam(bottom[i], node))
+        beams.append(structure.Beam(node, bottom[i + 1]))
+    return bottom[1:-1] + top, fixed, beams
+
+
+def pratt_truss(panels: int, panel_width: float = 1, height: float = 1) -> tuple:
+    """Makes a Pratt truss (verticals with diagonals sloping down towards the middle) with the given
+    number of panels (at least 2). Returns the nodes, fixed nodes and beams (4 * panels - 3 beams)"""
+    bottom = [structure.Node((i * panel_width, 0)) for i in range(1, panels)]
+    fixed = [structure.FixedNode((0, 0)), structure.FixedNode((panels * panel_width, 0))]
+    bottom = [fixed[0]] + bottom + [fixed[1]]
+    top = {i: structure.Node((i * panel_width, height)) for i in range(1, panels)}
+
+    beams = [structure.Beam(a, b) for a, b in zip(bottom, bottom[1:])]  # bottom chord
+    beams += [structure.Beam(top[i], top[i + 1]) for i in range(1, panels - 1)]  # top chord
+    beams += [structure.Beam(bottom[i], top[i]) for i in range(1, panels)]  # verticals
+    # the end posts then the diagonals
+    beams.append(structure.Beam(bottom[0], top[1]))
+    beams.append(structure.Beam(bottom[panels], top[panels - 1]))
+    for i in range(1, panels - 1):
+        if i < panels / 2:
+            beams.append(structure.Beam(top[i], bottom[i + 1]))
+        else:
+            beams.append(structure.Beam(bottom[i], top[i + 1]))
+    return bottom[1:-1] + list(top.values()), fixed, beams
+
+
+def random_structure(beam_count: int, seed: int = 0, span: float = 100, height: float = 10) -> tuple:
+    """Makes a random rigid structure with about beam_count beams between two fixed nodes.
+    Returns the nodes, fixed nodes and beams"""
+    generator = random.Random(seed)
+    fixed = [structure.FixedNode((0, 0)), structure.FixedNode((span, 0))]
+    nodes = [structure.Node((generator.uniform(0, span), generator.uniform(0, height)))
+             for _ in range(max(1, beam_count // 2 - 1))]
+    every_node = fixed + nodes
+
+    # join each node to two earlier ones so that none of them can move (the fixed nodes are already held),
+    # then add random extra beams
+    pairs = set()
+    for i in range(2, len(every_node)):
+        for j in generator.sample(range(i), 2):
+            pairs.add((j, i))
+    while len(pairs) < beam_count and len(pairs) < len(every_node) * (len(every_node) - 1) // 2:
+        a, b = generator.randrange(len(every_node)), generator.randrange(len(every_node))
+        if a != b and (b, a) not in pairs:
+            pairs.add((a, b))
+    beams = [structure.Beam(every_node[a], every_node[b]) for a, b in sorted(pairs)]
+    return nodes, fixed, beams
+
+
+PATTERNS = {
+    "warren": lambda size: warren_truss(max(1, (size + 1) // 4)),
+    "pratt": lambda size: pratt_truss(max(2, (size + 3) // 4)),
+    "random": random_structure,
+}
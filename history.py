@@ -0,0 +1,99 @@
+import collections
+import structure
+
+
+class AddStructures:
+    """Nodes and beams that were added (nodes come before the beams joined to them)"""
+    def __init__(self, structures: list):
+        self.structures = structures
+
+    @property
+    def size(self):
+        return len(self.structures)
+
+    def undo(self, app):
+        for i in reversed(self.structures):
+            app.remove_structure(i)
+
+    def redo(self, app):
+        for i in self.structures:
+            app.add_structure(i)
+
+
+class RemoveStructures(AddStructures):
+    """Nodes and beams that were removed, including the beams that were removed with a node"""
+    def __init__(self, structures: list):
+        # the nodes have to go back before the beams joined to them
+        nodes = [i for i in structures if isinstance(i, structure.Node)]
+        beams = [i for i in structures if not isinstance(i, structure.Node)]
+        super().__init__(nodes + beams)
+
+    def undo(self, app):
+        super().redo(app)
+
+    def redo(self, app):
+        super().undo(app)
+
+
+class MoveNodes:
+    """Nodes that were moved, only the start and end positions of a whole drag are stored"""
+    def __init__(self, moves: dict):
+        self.moves = moves  # node -> (old position, new position)
+
+    @property
+    def size(self):
+        return len(self.moves)
+
+    def undo(self, app):
+        for node, (old, _) in self.moves.items():
+            node.position = old
+
+    def redo(self, app):
+        for node, (_, new) in self.moves.items():
+            node.position = new
+
+
+class History:
+    """Stores the edits made to the structure so they can be undone and redone. Each edit only stores
+    what changed so undoing or redoing takes time proportional to the edit. The oldest edits are
+    forgotten once there are more than max_edits or they hold more than max_size structures."""
+    def __init__(self, max_edits: int = 1000, max_size: int = 100000):
+        self.max_edits = max_edits
+        self.max_size = max_size
+        self._undo = collections.deque()
+        self._redo = []
+        self._size = 0
+
+    def record(self, edit):
+        if edit.size == 0:
+            return
+        self._undo.append(edit)
+        self._size += edit.size
+        for i in self._redo:
+            self._size -= i.size
+        self._redo = []  # a new edit means the undone ones cannot be redone
+        while self._undo and (len(self._undo) > self.max_edits or self._size > self.max_size):
+            self._size -= self._undo.popleft().size
+
+    def undo(self, app) -> bool:
+        """Undoes the last edit, returns False if there was nothing to undo"""
+        if not self._undo:
+            return False
+        edit = self._undo.pop()
+        edit.undo(app)
+        self._redo.append(edit)
+        return True
+
+    def redo(self, app) -> bool:
+        """Redoes the last undone edit, returns False if there was nothing to redo"""
+        if not self._redo:
+            return False
+        edit = self._redo.pop()
+        edit.redo(app)
+        self._undo.append(edit)
+        return True
+
+    def clear(self):
+        self._undo.clear()
+        self._redo = []
+        self._size = 0
@@ -0,0 +1,170 @@
+import argparse
+import bisect
+import sys
+import time
+import physics
+import storage
+
+try:
+    import numpy
+except ImportError:  # numpy is optional, everything falls back to pure python without it
+    numpy = None
+
+
+def deck_nodes(nodes: list, fixed: list) -> list:
+    """The nodes that a moving load travels along, taken to be the ones level with the lowest fixed node,
+    in order from left to right"""
+    if not fixed:
+        raise Exception("There are no fixed nodes so there is no deck")
+    height = min(node.position[1] for node in fixed)
+    return sorted((node for node in nodes + fixed if node.position[1] == height), key=lambda node: node.position[0])
+
+
+class InfluenceLines:
+    """The member forces and reactions caused by a unit downward load at each deck node.
+    The stiffness matrix is factorised once and every deck node (and the self weight) is solved
+    as one batch of right hand sides. A load between two deck nodes is split between them
+    by how close it is to each, so the lines are straight between the deck nodes."""
+    def __init__(self, nodes: list, fixed: list, beams: list, deck: list = None, check=None):
+        self.deck = deck_nodes(nodes, fixed) if deck is None else deck
+        if len(self.deck) < 2:
+            raise Exception("The deck needs at least two nodes for a load to move along")
+        self.xs = [node.position[0] for node in self.deck]
+        if any(x1 >= x2 for x1, x2 in zip(self.xs, self.xs[1:])):
+            raise Exception("The deck nodes must all be at different positions")
+
+        # the names of the values found for each load, the beams then the fixed nodes
+        self.quantities = [f"beam {i}" for i in range(len(beams))]
+        for i in range(len(fixed)):
+            self.quantities += [f"fixed {i} horizontal", f"fixed {i} vertical"]
+
+        truss = physics.Truss(nodes, fixed, beams)
+        cases = [{node: (0.0, -1.0)} for node in self.deck] + [truss.self_weight()]
+        solutions = truss.displacements([truss.force_vector(loads) for loads in cases], check)
+        rows = []
+        for loads, solution in zip(cases, solutions):
+            forces = truss.member_forces(solution)
+            row = forces
+            for reaction in truss.reactions(loads, forces):
+                row += reaction
+            rows.append(row)
+        self.lines = rows[:-1]  # one row for each deck node
+        self.self_weight = rows[-1]  # the values from the weight of the beams alone
+
+    def load_weights(self, positions: list, axles: list) -> list:
+        """For each position of the front of the axle group, how much load ends up on each deck node.
+        axles is a list of (offset behind the front, load), any axle off the deck is ignored."""
+        xs = self.xs
+        weights = []
+        for position in positions:
+            row = {}
+            for offset, load in axles:
+                x = position - offset
+                if x < xs[0] or x > xs[-1]:
+                    continue
+                k = min(bisect.bisect_right(xs, x), len(xs) - 1)
+                t = (x - xs[k-1]) / (xs[k] - xs[k-1])
+                row[k-1] = row.get(k-1, 0) + load * (1 - t)
+                row[k] = row.get(k, 0) + load * t
+            weights.append(row)
+        return weights
+
+    def sweep(self, axles: list = ((0, 1),), steps: int = 1000, start: float = None, end: float = None):
+        """Moves the axle group across the deck, from the front axle reaching the deck to the
+        last axle leaving it unless a start and end are given"""
+        offsets = [offset for offset, _ in axles]
+        start = self.xs[0] + min(offsets) if start is None else start
+        end = self.xs[-1] + max(offsets) if end is None else end
+        positions = [start + (end - start) * i / max(steps - 1, 1) for i in range(steps)]
+        weights = self.load_weights(positions, axles)
+
+        if numpy is not None:
+            # every position is found at once as one matrix multiplication
+            matrix = numpy.zeros((len(positions), len(self.xs)))
+            for i, row in enumerate(weights):
+                for k, weight in row.items():
+                    matrix[i, k] = weight
+            values = (matrix @ numpy.asarray(self.lines)).tolist()
+        else:
+            values = []
+            for row in weights:
+                total = [0.0] * len(self.quantities)
+                for k, weight in row.items():
+                    line = self.lines[k]
+                    for j in range(len(total)):
+                        total[j] += weight * line[j]
+                values.append(total)
+        return Sweep(self, positions, values)
+
+
+class Sweep:
+    """The values (without the self weight) for each position of a moving load"""
+    def __init__(self, lines: InfluenceLines, positions: list, values: list):
+        self.lines = lines
+        self.positions = positions
+        self.values = values
+
+    def envelope(self, self_weight: bool = True) -> list:
+        """The smallest and largest value of each quantity over all of the positions,
+        with the self weight added on unless told not to"""
+        envelope = []
+        for j in range(len(self.lines.quantities)):
+            column = [row[j] for row in self.values] or [0.0]
+            dead = self.lines.self_weight[j] if self_weight else 0
+            envelope.append((min(column) + dead, max(column) + dead))
+        return envelope
+
+    def save(self, path: str):
+        """Writes the value of every quantity at every position as a csv file"""
+        with open(path, "w") as file:
+            file.write(",".join(["position"] + self.lines.quantities) + "\n")
+            file.writelines(",".join(map(repr, [position] + row)) + "\n"
+                            for position, row in zip(self.positions, self.values))
+
+    def save_envelope(self, path: str, self_weight: bool = True):
+        """Writes the self weight and the smallest and largest value of each quantity as a csv file"""
+        with open(path, "w") as file:
+            file.write("quantity,self weight,min,max\n")
+            for name, dead, (low, high) in zip(self.lines.quantities, self.lines.self_weight,
+                                               self.envelope(self_weight)):
+                file.write(f"{name},{dead!r},{low!r},{high!r}\n")
+
+
+def parse_axles(text: str) -> list:
+    """Reads axles written as offset:load separated by commas, e.g. 0:50000,3:50000"""
+    axles = []
+    for axle in text.split(","):
+        offset, load = axle.split(":")
+        axles.append((float(offset), float(load)))
+    return axles
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Moves a load across the deck of a structure and finds the "
+                                                 "forces at every position")
+    parser.add_argument("path", help="structure file")
+    parser.add_argument("-l", "--load", type=float, default=1.0, help="size of a single point load (default 1)")
+    parser.add_argument("-a", "--axles", type=parse_axles, help="axle group as offset:load,offset:load,...")
+    parser.add_argument("-s", "--steps", type=int, default=1000, help="number of load positions")
+    parser.add_argument("-o", "--output", help="csv file for the values at every position")
+    parser.add_argument("-e", "--envelope", help="csv file for the envelope of every quantity")
+    args = parser.parse_args(args)
+
+    nodes, fixed, beams = storage.load_structure(args.path)
+    start = time.perf_counter()
+    lines = InfluenceLines(nodes, fixed, beams)
+    sweep = lines.sweep(args.axles or [(0, args.load)], args.steps)
+    print(f"Swept {len(sweep.positions)} positions over {len(lines.deck)} deck nodes "
+          f"in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    if args.output:
+        sweep.save(args.output)
+    if args.envelope:
+        sweep.save_envelope(args.envelope)
+    if not args.output and not args.envelope:
+        for name, (low, high) in zip(lines.quantities, sweep.envelope()):
+            print(f"{name}: {low:.6g} to {high:.6g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
+import sys
 import app
 
 if __name__ == "__main__":
-    app = app.App((1800, 1000))
+    # the structure file to save to and load from can be given as an argument
+    app = app.App((1800, 1000), *sys.argv[1:2])
     app.main_menu()
@@ -1,5 +1,11 @@
 
 
+try:
+    import numpy
+except ImportError:  # numpy is optional, everything falls back to pure python without it
+    numpy = None
+
+
 def increase_index(value):
     if isinstance(value, slice):
         value = slice(None if value.start is None else value.start - 1,
@@ -104,25 +110,300 @@ class Matrix:
                         for j in range(self._size[1])]
                        for i in range(self._size[0])])
 
+    def lu(self):
+        """Returns the LU factorisation of the matrix so that it can be reused"""
+        return LUDecomposition(self._values)
+
     def inverse(self):
-        det = self.determinant()
-        if det == 0:
+        # solving for each column of the identity is O(n^3) rather than the factorial
+        # time of the cofactor method
+        columns = self.lu().solve_many([[int(i == j) for i in range(self._size[0])]
+                                        for j in range(self._size[0])])
+        return Matrix(columns).transposed()
+
+
+class LUDecomposition:
+    """The LU factorisation (with partial pivoting) of a square matrix. Factorising is O(n^3)
+    and done once, each right hand side is then solved by forward and back substitution in O(n^2)"""
+    def __init__(self, values, tolerance=1e-12):
+        size = len(values)
+        if any(len(row) != size for row in values):
+            raise Exception("Matrix is not square so it cannot be factorised")
+
+        lu = [[float(value) for value in row] for row in values]
+        permutation = list(range(size))
+        # each pivot is compared against the largest entry of its own row so that near singular
+        # matrices are caught without rejecting rows that are just on a different scale
+        scales = [max(map(abs, row), default=0) for row in lu]
+        if 0 in scales:
             raise Exception("Matrix is singular so no inverse exists")
-        m = [[Matrix.minor(self._values, (i, j)).determinant()
-              for j in range(1, self._size[1]+1)]
-             for i in range(1, self._size[0]+1)]
-        m = [[value * (-1)**(i+j)
-              for j, value in enumerate(row)]
-             for i, row in enumerate(m)]
-        m = Matrix(m).transposed()
-        return (1/det) * m
+
+        for k in range(size):
+            # scaled partial pivoting - swap in the row with the largest value in this column for its scale
+            pivot_index = max(range(k, size), key=lambda r: abs(lu[r][k]) / scales[r])
+            if abs(lu[pivot_index][k]) <= tolerance * scales[pivot_index]:
+                raise Exception("Matrix is singular so no inverse exists")
+            if pivot_index != k:
+                lu[k], lu[pivot_index] = lu[pivot_index], lu[k]
+                scales[k], scales[pivot_index] = scales[pivot_index], scales[k]
+                permutation[k], permutation[pivot_index] = permutation[pivot_index], permutation[k]
+
+            pivot_row = lu[k]
+            pivot = pivot_row[k]
+            for row in lu[k+1:]:
+                factor = row[k] / pivot
+                row[k] = factor  # the lower matrix is stored where the zeros would be
+                if factor != 0:
+                    row[k+1:] = [a - factor * b for a, b in zip(row[k+1:], pivot_row[k+1:])]
+
+        self.size = size
+        self._lu = lu
+        self._permutation = permutation
+
+    def solve(self, solutions: list) -> list:
+        """Solves the system for a single right hand side"""
+        if len(solutions) != self.size:
+            raise Exception("The number of solutions does not match the size of the matrix")
+        lu = self._lu
+        # forward substitution (the lower matrix has 1s on the diagonal)
+        y = [float(solutions[i]) for i in self._permutation]
+        for i in range(self.size):
+            row = lu[i]
+            y[i] -= sum(row[j] * y[j] for j in range(i))
+        # back substitution
+        for i in reversed(range(self.size)):
+            row = lu[i]
+            y[i] = (y[i] - sum(row[j] * y[j] for j in range(i+1, self.size))) / row[i]
+        return y
+
+    def solve_many(self, solutions: list) -> list:
+        """Solves the system for each of the right hand sides given, reusing the factorisation"""
+        return [self.solve(i) for i in solutions]
 
 
 def solve_simultaneous(equations: list, solutions: list) -> list:
     """Takes a 2d array of the equations with each position representing a coefficient of a variable
     and a 1d array of the answers to the equations and returns the solutions in a 1d array.
     i.e. 2x + 3y = 5 and 3x + y = 2 would be input as solve_simultaneous([[2, 3], [3, 1]], [5, 2])"""
-    equations, solutions = Matrix(equations), Matrix([[i] for i in solutions])  # Turning the inputs into 2d matrices
-    solns = equations.inverse() * solutions  # gets the solutions as a 2d array
-    return [i[0] for i in solns]
+    return LUDecomposition(equations).solve(solutions)
+
+
+def solve_simultaneous_batch(equations: list, solutions: list, tolerance: float = 1e-12) -> list:
+    """Solves many systems of simultaneous equations of the same size at once. Takes a list of
+    the 2d arrays of equations and a list of the 1d arrays of answers (one for each system)
+    and returns a list of the solutions of each system.
+    Uses numpy to solve them all in one go if it is installed, in which case a system is taken
+    to be singular if its condition number (once each row is scaled to a largest entry of 1)
+    is more than 1 / tolerance, the same as the pivot test of the LU factorisation."""
+    if len(equations) != len(solutions):
+        raise Exception("There must be one set of solutions for each set of equations")
+    if len(equations) == 0:
+        return []
+
+    if numpy is None:
+        return [LUDecomposition(a, tolerance).solve(b) for a, b in zip(equations, solutions)]
+
+    a = numpy.asarray(equations, dtype=float)
+    b = numpy.asarray(solutions, dtype=float)
+    if a.ndim != 3 or a.shape[1] != a.shape[2] or b.shape != a.shape[:2]:
+        raise Exception("The systems of equations must all be square and of the same size")
+    scales = numpy.abs(a).max(axis=2) if a.shape[1] else numpy.ones(a.shape[:2])
+    if (scales == 0).any():
+        raise Exception("Matrix is singular so no inverse exists")
+    if a.shape[1] and (numpy.linalg.cond(a / scales[..., None]) > 1 / tolerance).any():
+        raise Exception("Matrix is singular so no inverse exists")
+    try:
+        solns = numpy.linalg.solve(a, b[..., None])[..., 0]
+    except numpy.linalg.LinAlgError:
+        raise Exception("Matrix is singular so no inverse exists")
+    if not numpy.isfinite(solns).all():
+        raise Exception("Matrix is singular so no inverse exists")
+    return solns.tolist()
+
+
+class SparseMatrix:
+    """A square sparse matrix stored in compressed sparse row (CSR) format.
+    Only the non zero values are stored so the memory and the multiplication scale with them."""
+    def __init__(self, size, row_starts, columns, values):
+        self.size = size
+        self.row_starts = row_starts  # row i is stored between row_starts[i] and row_starts[i+1]
+        self.columns = columns
+        self.values = values
+
+    @classmethod
+    def from_triplets(cls, size, rows, columns, values):
+        """Builds the matrix from coordinate (COO) triplets, any duplicate positions are added together"""
+        # bucket the triplets by their row
+        buckets = [[] for _ in range(size)]
+        for i, j, value in zip(rows, columns, values):
+            buckets[i].append((j, value))
+
+        row_starts = [0]
+        csr_columns = []
+        csr_values = []
+        for bucket in buckets:
+            bucket.sort()
+            last = None
+            for j, value in bucket:
+                if j == last:  # merge duplicates as they are next to each other once sorted
+                    csr_values[-1] += value
+                else:
+                    csr_columns.append(j)
+                    csr_values.append(value)
+                    last = j
+            row_starts.append(len(csr_columns))
+        return cls(size, row_starts, csr_columns, csr_values)
+
+    @property
+    def non_zeros(self):
+        return len(self.values)
+
+    def row(self, i):
+        """Returns the columns and values of the given row (0 indexed)"""
+        start, end = self.row_starts[i], self.row_starts[i+1]
+        return self.columns[start:end], self.values[start:end]
+
+    def diagonal(self):
+        diagonal = [0.0] * self.size
+        for i in range(self.size):
+            for j, value in zip(*self.row(i)):
+                if i == j:
+                    diagonal[i] = value
+        return diagonal
+
+    def __mul__(self, vector):
+        if len(vector) != self.size:
+            raise Exception("The vector cannot be multiplied as the dimensions are incompatible.")
+        return [sum(value * vector[j] for j, value in zip(*self.row(i))) for i in range(self.size)]
+
+
+def reverse_cuthill_mckee(matrix: SparseMatrix) -> list:
+    """Returns an ordering of the rows of a symmetric sparse matrix that keeps the non zero values
+    close to the diagonal. order[new] gives the original index."""
+    degree = [matrix.row_starts[i+1] - matrix.row_starts[i] for i in range(matrix.size)]
+    visited = [False] * matrix.size
+    order = []
+    # each connected part of the matrix is started from its lowest degree row
+    for start in sorted(range(matrix.size), key=degree.__getitem__):
+        if visited[start]:
+            continue
+        visited[start] = True
+        head = len(order)
+        order.append(start)
+        while head < len(order):  # breadth first search using the order as the queue
+            current = order[head]
+            head += 1
+            neighbours = [j for j in matrix.row(current)[0] if not visited[j]]
+            neighbours.sort(key=degree.__getitem__)
+            for j in neighbours:
+                visited[j] = True
+                order.append(j)
+    order.reverse()
+    return order
+
+
+class EnvelopeCholesky:
+    """The Cholesky factorisation of a symmetric positive definite sparse matrix. The rows are reordered
+    so that only the envelope (from the first non zero value in each row to the diagonal) is stored,
+    which is small for long thin structures such as bridges. Once factorised it can be reused
+    for any number of right hand sides.
+    check is called every so often while factorising and can raise an exception to stop it."""
+    def __init__(self, matrix: SparseMatrix, tolerance=1e-9, check=None):
+        order = reverse_cuthill_mckee(matrix)
+        position = [0] * matrix.size
+        for new, old in enumerate(order):
+            position[old] = new
+
+        # finding the envelope of each (reordered) row
+        first = list(range(matrix.size))
+        for old in range(matrix.size):
+            i = position[old]
+            for j in matrix.row(old)[0]:
+                j = position[j]
+                if j < first[i]:
+                    first[i] = j
+        envelope = [[0.0] * (i - first[i] + 1) for i in range(matrix.size)]
+        for old in range(matrix.size):
+            i = position[old]
+            for j, value in zip(*matrix.row(old)):
+                j = position[j]
+                if j <= i:
+                    envelope[i][j - first[i]] = value
+
+        # row by row Cholesky, the row of L is stored over the row of the matrix
+        for i in range(matrix.size):
+            if check is not None and i % 256 == 0:
+                check()
+            fi = first[i]
+            row = envelope[i]
+            for j in range(fi, i):
+                fj = first[j]
+                other = envelope[j]
+                start = max(fi, fj)
+                total = sum(a * b for a, b in zip(row[start-fi:j-fi], other[start-fj:j-fj]))
+                row[j-fi] = (row[j-fi] - total) / other[j-fj]
+            diagonal = row[i-fi]
+            pivot = diagonal - sum(value * value for value in row[:i-fi])
+            # a pivot that has (nearly) vanished means there is nothing resisting that direction
+            if pivot <= tolerance * abs(diagonal) or pivot <= 0:
+                raise Exception("Matrix is singular so no inverse exists")
+            row[i-fi] = pivot ** (1/2)
+
+        self.size = matrix.size
+        self._order = order
+        self._first = first
+        self._envelope = envelope
+
+    def solve(self, solutions: list) -> list:
+        """Solves the system for a single right hand side"""
+        if len(solutions) != self.size:
+            raise Exception("The number of solutions does not match the size of the matrix")
+        first, envelope = self._first, self._envelope
+        y = [float(solutions[old]) for old in self._order]
+        # forward substitution with L
+        for i in range(self.size):
+            fi = first[i]
+            row = envelope[i]
+            y[i] = (y[i] - sum(a * b for a, b in zip(row[:i-fi], y[fi:i]))) / row[i-fi]
+        # back substitution with L transposed, done a column at a time
+        for i in reversed(range(self.size)):
+            fi = first[i]
+            row = envelope[i]
+            y[i] /= row[i-fi]
+            value = y[i]
+            if value != 0:
+                for k in range(fi, i):
+                    y[k] -= row[k-fi] * value
+        x = [0.0] * self.size
+        for new, old in enumerate(self._order):
+            x[old] = y[new]
+        return x
 
+    def solve_many(self, solutions: list) -> list:
+        """Solves the system for each of the right hand sides given, reusing the factorisation.
+        With numpy all of the right hand sides go through each row of the factorisation together."""
+        if numpy is None or not solutions:
+            return [self.solve(i) for i in solutions]
+        b = numpy.asarray(solutions, dtype=float)
+        if b.ndim != 2 or b.shape[1] != self.size:
+            raise Exception("The number of solutions does not match the size of the matrix")
+        first = self._first
+        rows = [numpy.asarray(row) for row in self._envelope]
+        y = b.T[self._order].copy()  # one row per (reordered) unknown, one column per right hand side
+        # forward substitution with L
+        for i in range(self.size):
+            fi = first[i]
+            row = rows[i]
+            if fi < i:
+                y[i] -= row[:i-fi] @ y[fi:i]
+            y[i] /= row[i-fi]
+        # back substitution with L transposed, done a column of L at a time
+        for i in reversed(range(self.size)):
+            fi = first[i]
+            row = rows[i]
+            y[i] /= row[i-fi]
+            if fi < i:
+                y[fi:i] -= numpy.outer(row[:i-fi], y[i])
+        x = numpy.empty_like(y)
+        x[self._order] = y
+        return x.T.tolist()
@@ -0,0 +1,147 @@
+import argparse
+import functools
+import heapq
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import generate
+import physics
+import storage
+import structure
+
+PATTERNS = {"warren": generate.warren_truss, "pratt": generate.pratt_truss}
+
+
+def random_candidate(generator: random.Random, span: float, max_panels: int) -> tuple:
+    """Picks the parameters of a candidate bridge, only these are sent to the processes
+    (rather than the nodes and beams) as they are much smaller"""
+    pattern = generator.choice(sorted(PATTERNS))
+    panels = generator.randint(2, max_panels)
+    height = generator.uniform(span / 20, span / 3)
+    curve = generator.uniform(0, 1)  # 0 is a flat top, 1 is a parabola that comes down to the supports
+    return pattern, panels, height, curve, generator.getrandbits(32)
+
+
+def build(span: float, candidate: tuple) -> tuple:
+    """Makes the bridge described by the candidate, returns the nodes, fixed nodes and beams"""
+    pattern, panels, height, curve, seed = candidate
+    nodes, fixed, beams = PATTERNS[pattern](panels, span / panels, height)
+    # shaping the top chord and moving each top node up or down a little
+    generator = random.Random(seed)
+    for node in nodes:
+        x, y = node.position
+        if y > 0:
+            middle = 2 * x / span - 1  # -1 at one support and 1 at the other
+            shape = 1 - curve * middle * middle
+            node.position = x, max(height * shape, height / 10) * generator.uniform(0.9, 1.1)
+    return nodes, fixed, beams
+
+
+def evaluate(candidate: tuple, span: float, load: float) -> tuple:
+    """Solves the candidate with its own weight and a load (in N per metre) along the deck.
+    Returns (mass, largest utilisation, candidate), the mass is None if it is not complete,
+    cannot be solved or a beam fails (yields or buckles) the same check the app colours beams by."""
+    nodes, fixed, beams = build(span, candidate)
+    if not physics.check_complete(nodes, fixed, beams):
+        return None, None, candidate
+    try:
+        truss = physics.Truss(nodes, fixed, beams)
+        loads = truss.self_weight()
+        # the deck load is shared between the nodes along the bottom by the length each one holds up
+        deck = sorted((node for node in loads if node.position[1] == 0), key=lambda node: node.position[0])
+        for i, node in enumerate(deck):
+            left = deck[i-1].position[0] if i > 0 else node.position[0]
+            right = deck[i+1].position[0] if i < len(deck) - 1 else node.position[0]
+            loads[node][1] -= load * (right - left) / 2
+        forces = truss.member_forces(truss.displacements([truss.force_vector(loads)])[0])
+    except Exception:
+        return None, None, candidate
+    model = structure.Model()
+    for node in nodes + fixed:
+        model.add_node(node)
+    for beam in beams:
+        model.add_beam(beam)
+    largest = max(physics.member_utilisation(model, forces))
+    if largest >= 1:
+        return None, largest, candidate
+    return sum(i.mass for i in beams), largest, candidate
+
+
+class Frontier:
+    """Keeps the best (lightest) size results seen so far. It is a heap with the heaviest
+    kept result at the top so each new result is compared against it in O(1) and added in O(log size)."""
+    def __init__(self, size: int):
+        self.size = size
+        self._heap = []  # (-mass, order, result) so the heaviest is at the top
+        self._count = 0
+
+    def add(self, mass: float, result) -> bool:
+        """Returns True if the result was kept"""
+        self._count += 1  # stops results with the same mass being compared
+        item = (-mass, self._count, result)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, item)
+            return True
+        if item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+            return True
+        return False
+
+    def best(self) -> list:
+        """Returns the kept (mass, result) from lightest to heaviest"""
+        return [(-mass, result) for mass, _, result in sorted(self._heap, reverse=True)]
+
+
+def optimise(span: float, candidates: int, keep: int = 10, load: float = 1000, max_panels: int = 12, seed: int = 0, workers: int = None) -> tuple:
+    """Evaluates random candidates in parallel and returns the frontier of the best ones
+    and the number of candidates that were feasible"""
+    generator = random.Random(seed)
+    parameters = [random_candidate(generator, span, max_panels) for _ in range(candidates)]
+    frontier = Frontier(keep)
+    feasible = 0
+    task = functools.partial(evaluate, span=span, load=load)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # large chunks keep the overhead of sending the candidates down as each one is quick to solve
+        chunksize = max(1, candidates // (8 * (workers or os.cpu_count() or 1)))
+        for mass, largest, candidate in pool.map(task, parameters, chunksize=chunksize):
+            if mass is not None:
+                feasible += 1
+                frontier.add(mass, (largest, candidate))
+    return frontier, feasible
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Searches for the lightest bridge over a span "
+                                                 "without any beam yielding or buckling")
+    parser.add_argument("span", type=float, help="distance between the two fixed nodes")
+    parser.add_argument("-n", "--candidates", type=int, default=1000, help="number of candidates to try")
+    parser.add_argument("-k", "--keep", type=int, default=10, help="number of the best bridges to save")
+    parser.add_argument("-l", "--load", type=float, default=1000, help="load along the deck in N per metre")
+    parser.add_argument("-p", "--max-panels", type=int, default=12, help="most panels a candidate can have")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed for the random candidates")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of processes (default all cores)")
+    parser.add_argument("-o", "--output", default="optimised", help="directory to save the best bridges in")
+    args = parser.parse_args(args)
+
+    start = time.perf_counter()
+    frontier, feasible = optimise(args.span, args.candidates, args.keep, args.load, args.max_panels,
+                                  args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f"Evaluated {args.candidates} candidates ({feasible} feasible) in {elapsed:.2f}s "
+          f"({args.candidates / elapsed:.0f} per second)", file=sys.stderr)
+
+    # saving the best ones so they can be opened in the app
+    os.makedirs(args.output, exist_ok=True)
+    for rank, (mass, (largest, candidate)) in enumerate(frontier.best(), 1):
+        path = os.path.join(args.output, f"{rank:02d}{storage.BINARY_EXTENSION}")
+        storage.save_structure(path, *build(args.span, candidate))
+        pattern, panels, height, curve, _ = candidate
+        print(json.dumps({"file": path, "mass": mass, "utilisation": largest, "pattern": pattern,
+                          "panels": panels, "height": height, "curve": curve}))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,541 @@
+import collections
 import matrix_maths
 import math
 import structure
 
+try:
+    import numpy
+except ImportError:  # numpy is optional, everything falls back to pure python without it
+    numpy = None
 
-def check_complete(nodes: list, fixed: list, beams: list):
-    """Checks if all the nodes are connected into one structure"""
-    # the bridge needs at least 2 fixed nodes
-    if len(fixed) < 2:
+
+class Connectivity:
+    """Keeps track of which nodes are joined together by beams using a disjoint set (union find)
+    that is updated as structures are added, so checking if the structure is complete is almost O(1).
+    Removing a beam searches outwards from both of its ends until the searches meet, and only if they
+    never meet is the group split up. Split groups are worked out again lazily, so removing many
+    beams at once only rebuilds each group once."""
+    def __init__(self):
+        self._parent = {}
+        self._members = {}  # the nodes in each group, stored against the root of the group
+        self._neighbours = {}  # node -> {neighbour: number of beams joining them}
+        self._dirty = set()  # the nodes of the groups that have been split and need working out again
+        self.groups = 0  # not counting the dirty nodes until they are worked out again
+        self.fixed = 0
+
+    def find(self, node):
+        """Returns the root of the group that the node is in"""
+        self._regroup()
+        return self._root(node)
+
+    def _root(self, node):
+        parent = self._parent
+        while parent[node] is not node:
+            parent[node] = parent[parent[node]]  # path halving keeps the trees flat
+            node = parent[node]
+        return node
+
+    def _union(self, node1, node2):
+        root1, root2 = self._root(node1), self._root(node2)
+        if root1 is root2:
+            return
+        # the smaller group is joined onto the larger one
+        if len(self._members[root1]) < len(self._members[root2]):
+            root1, root2 = root2, root1
+        self._parent[root2] = root1
+        self._members[root1].extend(self._members.pop(root2))
+        self.groups -= 1
+
+    def add_node(self, node):
+        self._parent[node] = node
+        self._members[node] = [node]
+        self._neighbours[node] = {}
+        self.groups += 1
+        if isinstance(node, structure.FixedNode):
+            self.fixed += 1
+
+    def add_beam(self, beam):
+        node1, node2 = beam.node1, beam.node2
+        self._neighbours[node1][node2] = self._neighbours[node1].get(node2, 0) + 1
+        self._neighbours[node2][node1] = self._neighbours[node2].get(node1, 0) + 1
+        self._regroup()
+        self._union(node1, node2)
+
+    def remove_beam(self, beam):
+        node1, node2 = beam.node1, beam.node2
+        for a, b in ((node1, node2), (node2, node1)):
+            neighbours = self._neighbours[a]
+            neighbours[b] -= 1
+            if neighbours[b] == 0:
+                del neighbours[b]
+        # a group that is already being worked out again does not need checking
+        if node2 not in self._neighbours[node1] and node1 not in self._dirty and not self._joined(node1, node2):
+            self._split(self._root(node1))
+
+    def remove_node(self, node):
+        if self._neighbours[node]:
+            for neighbour in self._neighbours[node]:
+                del self._neighbours[neighbour][node]
+            self._neighbours[node].clear()
+            if node not in self._dirty:
+                self._split(self._root(node))
+        if node in self._dirty:
+            self._dirty.discard(node)
+        else:
+            # a node without beams is in a group on its own
+            del self._members[node]
+            self.groups -= 1
+        del self._parent[node], self._neighbours[node]
+        if isinstance(node, structure.FixedNode):
+            self.fixed -= 1
+
+    def _joined(self, node1, node2) -> bool:
+        """Returns True if there is still a path of beams between the nodes. A breadth first search
+        is grown from each node, always the one that has reached fewer nodes, until they meet,
+        so an alternative path nearby is found quickly and a split costs about the smaller part"""
+        neighbours = self._neighbours
+        seen, other = {node1}, {node2}
+        queue, other_queue = collections.deque(seen), collections.deque(other)
+        while queue and other_queue:
+            if len(seen) > len(other):
+                seen, other, queue, other_queue = other, seen, other_queue, queue
+            for neighbour in neighbours[queue.popleft()]:
+                if neighbour in other:
+                    return True
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(neighbour)
         return False
 
-    # setting up the dictionary of conections
-    connections = {i: [] for i in nodes + fixed}
-    for beam in beams:
-        connections[beam.node1].append(beam.node2)
-        connections[beam.node2].append(beam.node1)
+    def _split(self, root):
+        """Marks the group as needing to be worked out again"""
+        self._dirty.update(self._members.pop(root))
+        self.groups -= 1
 
-    frontier = [(nodes + fixed)[0]]  # add a starting node to the frontier
-    explored = set()
+    def _regroup(self):
+        """Joins the nodes of the split groups back together using only their beams"""
+        if not self._dirty:
+            return
+        members, self._dirty = self._dirty, set()
+        for node in members:
+            self._parent[node] = node
+            self._members[node] = [node]
+        self.groups += len(members)
+        for node in members:
+            for neighbour in self._neighbours[node]:
+                self._union(node, neighbour)
 
-    # complete a breadth first search on the nodes
-    while len(frontier) != 0:
-        next = frontier.pop(0)
-        for i in connections[next]:
-            if i not in explored:
-                frontier.append(i)
-        explored.add(next)
+    def complete(self) -> bool:
+        """Returns True if there are at least 2 fixed nodes and all the nodes are connected"""
+        self._regroup()
+        return self.fixed >= 2 and self.groups == 1
 
-    # If the length of the explored is the same as all the nodes (and fixed)
-    # then all the nodes are connected.
-    # So return true if all the nodes are connected and there is at least 2 nodes.
-    return len(explored) == len(nodes+fixed)
+
+def check_complete(nodes: list, fixed: list, beams: list):
+    """Checks if all the nodes are connected into one structure"""
+    connectivity = Connectivity()
+    for node in nodes + fixed:
+        connectivity.add_node(node)
+    for beam in beams:
+        connectivity.add_beam(beam)
+    return connectivity.complete()
 
 
 def calculate_fixed(nodes: list, fixed: list, beams: list):
     """Calculates the vertical forces of the fixed nodes if they are on the same y level"""
+    # the moment of the beams about a node is x * total weight - sum(centre x * weight)
+    # so the totals only need working out once rather than for every fixed node
+    total_weight = sum(i.weight for i in beams)
+    total_moment = sum(i.centre[0] * i.weight for i in beams)
     equations = []
     solutions = []
     for node in fixed:
         row = [node.position[0] - i.position[0] for i in fixed]
         equations.append(row)
-        solutions.append(sum([(node.position[0] - i.centre[0])*i.weight for i in beams]))
+        solutions.append(node.position[0] * total_weight - total_moment)
 
     solutions = matrix_maths.solve_simultaneous(equations, solutions)
     for node, sol in zip(fixed, solutions):
         node.vertical_force = sol
 
 
+class Truss:
+    """The stiffness matrix of a pin jointed truss, which only depends on the geometry,
+    so it can be factorised once and reused for any number of load cases.
+    Each free node has an x and y degree of freedom, the fixed nodes are pinned and do not move."""
+    def __init__(self, nodes: list, fixed: list, beams: list):
+        self.nodes = nodes
+        self.fixed = fixed
+        self.beams = beams
+        self.dof = {node: 2 * i for i, node in enumerate(nodes)}
+        self.size = 2 * len(nodes)
+
+        rows, columns, values = [], [], []
+        self.members = []
+        for beam in beams:
+            (x1, y1), (x2, y2) = beam.ends
+            length = beam.length
+            if length == 0:
+                raise Exception("A beam has no length so the structure cannot be solved")
+            c, s = (x2 - x1)/length, (y2 - y1)/length
+            stiffness = beam.section.youngs_modulus * beam.section.area / length
+            self.members.append((beam, c, s, stiffness))
+
+            # adding the element stiffness matrix to the global one as triplets
+            local = (c*c, c*s, s*s)
+            block = ((local[0], local[1]), (local[1], local[2]))
+            ends = [(self.dof.get(beam.node1), 1), (self.dof.get(beam.node2), -1)]
+            for a, sign_a in ends:
+                for b, sign_b in ends:
+                    if a is None or b is None:
+                        continue  # the fixed nodes have no degrees of freedom
+                    for i in range(2):
+                        for j in range(2):
+                            rows.append(a + i)
+                            columns.append(b + j)
+                            values.append(sign_a * sign_b * stiffness * block[i][j])
+
+        self.stiffness_matrix = matrix_maths.SparseMatrix.from_triplets(self.size, rows, columns, values)
+        self._factorisation = None
+
+    def self_weight(self) -> dict:
+        """The loads on each node from the weight of the beams, half of each acts at each end"""
+        loads = {node: [0.0, 0.0] for node in self.nodes + self.fixed}
+        for beam in self.beams:
+            loads[beam.node1][1] -= beam.weight / 2
+            loads[beam.node2][1] -= beam.weight / 2
+        return loads
+
+    def force_vector(self, loads: dict) -> list:
+        """Turns the loads on the nodes into the vector for the free degrees of freedom"""
+        force_vector = [0.0] * self.size
+        for node, (x, y) in loads.items():
+            index = self.dof.get(node)
+            if index is not None:
+                force_vector[index], force_vector[index + 1] = x, y
+        return force_vector
+
+    def factorise(self, check=None):
+        if self._factorisation is None and self.size:
+            try:
+                self._factorisation = matrix_maths.EnvelopeCholesky(self.stiffness_matrix, check=check)
+            except Exception:
+                if check is not None:
+                    check()  # lets the reason for stopping through if the solve was stopped
+                raise Exception("The structure is a mechanism so it cannot be solved")
+        return self._factorisation
+
+    def displacements(self, force_vectors: list, check=None) -> list:
+        """Solves for the displacements of the free degrees of freedom under each of the force vectors,
+        all using the same factorisation"""
+        if not self.size:
+            return [[] for _ in force_vectors]
+        return self.factorise(check).solve_many(force_vectors)
+
+    def member_forces(self, solutions: list) -> list:
+        """The axial force in each beam (positive is tension) from the displacements"""
+        dof = self.dof
+        forces = []
+        for beam, c, s, stiffness in self.members:
+            i, j = dof.get(beam.node1), dof.get(beam.node2)
+            u1, v1 = (solutions[i], solutions[i+1]) if i is not None else (0.0, 0.0)
+            u2, v2 = (solutions[j], solutions[j+1]) if j is not None else (0.0, 0.0)
+            forces.append(stiffness * ((u2 - u1)*c + (v2 - v1)*s))
+        return forces
+
+    def reactions(self, loads: dict, forces: list) -> list:
+        """The [horizontal, vertical] force from each fixed node that balances the loads on it
+        and the beams pulling it"""
+        reactions = {}
+        for node in self.fixed:
+            x, y = loads.get(node, (0.0, 0.0))
+            reactions[node] = [-x, -y]
+        for (beam, c, s, _), force in zip(self.members, forces):
+            # the beam pulls each end towards the other when in tension
+            if beam.node1 in reactions:
+                reactions[beam.node1][0] -= force * c
+                reactions[beam.node1][1] -= force * s
+            if beam.node2 in reactions:
+                reactions[beam.node2][0] += force * c
+                reactions[beam.node2][1] += force * s
+        return [reactions[node] for node in self.fixed]
+
+
+def solve_truss(nodes: list, fixed: list, beams: list, check=None) -> dict:
+    """Solves the structure as a pin jointed truss using the direct stiffness method.
+    The weight of each beam is split between its two ends and the fixed nodes are pinned.
+    Sets the forces of the fixed nodes and the axial force of each beam (positive is tension),
+    and returns the displacement of each node.
+    check is called every so often and can raise an exception to stop the solve part way through."""
+    truss = Truss(nodes, fixed, beams)
+    loads = truss.self_weight()
+    solutions = truss.displacements([truss.force_vector(loads)], check)[0]
+
+    forces = truss.member_forces(solutions)
+    for beam, force in zip(beams, forces):
+        beam.force = force
+    for node, (horizontal, vertical) in zip(fixed, truss.reactions(loads, forces)):
+        node.horizontal_force, node.vertical_force = horizontal, vertical
+
+    displacements = {node: (solutions[i], solutions[i+1]) for node, i in truss.dof.items()}
+    displacements.update({node: (0.0, 0.0) for node in fixed})
+    return displacements
+
+
+class MomentTracker:
+    """Keeps running totals of the weight of the beams and of their moment about x = 0
+    (weight * centre x) which are updated whenever a beam is added, removed or moved.
+    With two fixed nodes their vertical forces can then be found in O(1) after every edit."""
+    def __init__(self):
+        self.total_weight = 0
+        self.total_moment = 0
+        self._contributions = {}  # beam -> (weight, moment) that it added to the totals
+        self._node_beams = {}  # node -> the beams joined to it, so they can be updated when it moves
+        self._updates = 0
+
+    @staticmethod
+    def _contribution(beam) -> tuple:
+        # the beam's geometry is always up to date with where the nodes are now
+        weight = beam.weight
+        return weight, weight * beam.centre[0]
+
+    def _add(self, beam):
+        weight, moment = self._contributions[beam] = self._contribution(beam)
+        self.total_weight += weight
+        self.total_moment += moment
+
+    def _subtract(self, beam):
+        weight, moment = self._contributions.pop(beam)
+        self.total_weight -= weight
+        self.total_moment -= moment
+
+    def add_beam(self, beam):
+        self._add(beam)
+        for node in (beam.node1, beam.node2):
+            if node not in self._node_beams:
+                self._node_beams[node] = set()
+                node.add_listener(self.node_moved)
+            self._node_beams[node].add(beam)
+
+    def remove_beam(self, beam):
+        self._subtract(beam)
+        for node in (beam.node1, beam.node2):
+            self._node_beams[node].discard(beam)
+            if not self._node_beams[node]:
+                del self._node_beams[node]
+                node.remove_listener(self.node_moved)
+
+    def node_moved(self, node):
+        """Called by the node whenever it is moved, only the beams joined to it are updated"""
+        for beam in self._node_beams[node]:
+            self._subtract(beam)
+            self._add(beam)
+        self._updates += 1
+        if self._updates > 100000:
+            self._recalculate()
+
+    def _recalculate(self):
+        """Adds the totals up again so that rounding errors do not build up"""
+        self._updates = 0
+        self.total_weight = sum(weight for weight, _ in self._contributions.values())
+        self.total_moment = sum(moment for _, moment in self._contributions.values())
+
+    def reactions(self, fixed: list):
+        """Returns the vertical forces of the two fixed nodes, or None if there are not exactly
+        two fixed nodes at different x positions"""
+        if len(fixed) != 2:
+            return None
+        x1, x2 = fixed[0].position[0], fixed[1].position[0]
+        if x1 == x2:
+            return None
+        # taking moments about the first fixed node
+        second = (self.total_moment - x1 * self.total_weight) / (x2 - x1)
+        return self.total_weight - second, second
+
+
+class Simulation:
+    """Simulates how the structure moves over time. Each beam is an axial spring (stiffness EA / L)
+    with half of its mass lumped at each end, and the fixed nodes do not move.
+    It uses semi implicit Euler (the velocities are updated before the positions) with a fixed time step
+    small enough to be stable for the stiffest spring, so one frame is split into several substeps.
+    The springs are worked out all at once with numpy if it is installed.
+    The positions are in the order of nodes then fixed. Giving a youngs_modulus uses it for every beam
+    instead of the beam's own material."""
+    def __init__(self, nodes: list, fixed: list, beams: list, youngs_modulus: float = None,
+                 damping: float = 1, safety: float = 0.5, max_substeps: int = 200):
+        all_nodes = nodes + fixed
+        index = {node: i for i, node in enumerate(all_nodes)}
+        self.count = len(all_nodes)
+        self.xs = [float(node.position[0]) for node in all_nodes]
+        self.ys = [float(node.position[1]) for node in all_nodes]
+        self.starts = [index[beam.node1] for beam in beams]
+        self.ends = [index[beam.node2] for beam in beams]
+        self.rest_lengths = [beam.length for beam in beams]
+        if any(length == 0 for length in self.rest_lengths):
+            raise Exception("A beam has no length so the structure cannot be simulated")
+        self.stiffnesses = [(youngs_modulus or beam.section.youngs_modulus) * beam.section.area / length
+                            for beam, length in zip(beams, self.rest_lengths)]
+        mass_per_lengths = [beam.section.mass_per_length for beam in beams]
+
+        # lumping the mass of each beam at its ends
+        masses = [0.0] * self.count
+        node_stiffness = [0.0] * self.count
+        for i, j, length, stiffness, mass_per_length in zip(self.starts, self.ends, self.rest_lengths,
+                                                            self.stiffnesses, mass_per_lengths):
+            mass = length * mass_per_length / 2
+            masses[i] += mass
+            masses[j] += mass
+            node_stiffness[i] += stiffness
+            node_stiffness[j] += stiffness
+        # fixed nodes and nodes without any beams (and so no mass) are held still
+        self.inverse_masses = [0.0 if i >= len(nodes) or mass == 0 else 1 / mass for i, mass in enumerate(masses)]
+        self.weights = [-mass * structure.GRAVITY for mass in masses]
+        self.loads = {}  # node index -> extra (horizontal, vertical) force on it
+
+        # the fastest the structure can vibrate is at most sqrt(2 * stiffness / mass) of any node
+        # and semi implicit Euler is only stable for time steps less than 2 / that
+        fastest = max([2 * k * m for k, m in zip(node_stiffness, self.inverse_masses)], default=0) ** (1/2)
+        self.time_step = safety * 2 / fastest if fastest else 1 / 60
+        self.decay = math.exp(-damping * self.time_step)  # how much of the velocity is kept each step
+        self.max_substeps = max_substeps
+        self.time = 0
+        self._waiting = 0  # time left over from the last frame that was not enough for a whole step
+
+        self.vxs = [0.0] * self.count
+        self.vys = [0.0] * self.count
+        if numpy is not None:
+            self._arrays = {
+                "xs": numpy.array(self.xs, dtype=float), "ys": numpy.array(self.ys, dtype=float),
+                "vxs": numpy.zeros(self.count), "vys": numpy.zeros(self.count),
+                "starts": numpy.array(self.starts, dtype=numpy.intp), "ends": numpy.array(self.ends, dtype=numpy.intp),
+                "rest": numpy.array(self.rest_lengths), "k": numpy.array(self.stiffnesses),
+                "inverse_masses": numpy.array(self.inverse_masses),
+            }
+            self._update_forces()
+
+    def set_load(self, index: int, force: tuple):
+        """Puts a (horizontal, vertical) force on the node at the index, (0, 0) removes it"""
+        if force == (0, 0):
+            self.loads.pop(index, None)
+        else:
+            self.loads[index] = force
+        if numpy is not None:
+            self._update_forces()
+
+    def _update_forces(self):
+        # the forces that do not depend on the positions
+        arrays = self._arrays
+        arrays["fxs"] = numpy.zeros(self.count)
+        arrays["fys"] = numpy.array(self.weights)
+        for i, (x, y) in self.loads.items():
+            arrays["fxs"][i] += x
+            arrays["fys"][i] += y
+
+    def step(self, frame_time: float) -> int:
+        """Moves the simulation on by the frame time, returns the number of substeps taken.
+        If that would take more than max_substeps the simulation falls behind rather than the frame."""
+        self._waiting += frame_time
+        substeps = int(self._waiting / self.time_step)
+        if substeps > self.max_substeps:
+            substeps = self.max_substeps
+            self._waiting = 0
+        else:
+            self._waiting -= substeps * self.time_step
+        if substeps:
+            if numpy is not None:
+                self._step_arrays(substeps)
+            else:
+                self._step_lists(substeps)
+            self.time += substeps * self.time_step
+        return substeps
+
+    def _step_arrays(self, substeps: int):
+        a = self._arrays
+        xs, ys, vxs, vys = a["xs"], a["ys"], a["vxs"], a["vys"]
+        starts, ends, rest, k = a["starts"], a["ends"], a["rest"], a["k"]
+        inverse_masses, fxs, fys = a["inverse_masses"], a["fxs"], a["fys"]
+        dt, decay, count = self.time_step, self.decay, self.count
+        for _ in range(substeps):
+            dx = xs[ends] - xs[starts]
+            dy = ys[ends] - ys[starts]
+            length = numpy.hypot(dx, dy)
+            # the tension divided by the length, so multiplying by dx and dy gives its components
+            tension = k * (length - rest) / numpy.maximum(length, 1e-12)
+            tx, ty = tension * dx, tension * dy
+            # a beam in tension pulls its start towards its end and its end towards its start
+            ax = (fxs + numpy.bincount(starts, tx, count) - numpy.bincount(ends, tx, count)) * inverse_masses
+            ay = (fys + numpy.bincount(starts, ty, count) - numpy.bincount(ends, ty, count)) * inverse_masses
+            vxs += dt * ax
+            vys += dt * ay
+            vxs *= decay
+            vys *= decay
+            xs += dt * vxs
+            ys += dt * vys
+        self.xs, self.ys = xs.tolist(), ys.tolist()
+        self.vxs, self.vys = vxs.tolist(), vys.tolist()
+
+    def _step_lists(self, substeps: int):
+        xs, ys, vxs, vys = self.xs, self.ys, self.vxs, self.vys
+        dt, decay = self.time_step, self.decay
+        springs = list(zip(self.starts, self.ends, self.rest_lengths, self.stiffnesses))
+        for _ in range(substeps):
+            fxs = [0.0] * self.count
+            fys = list(self.weights)
+            for i, (x, y) in self.loads.items():
+                fxs[i] += x
+                fys[i] += y
+            for i, j, rest, k in springs:
+                dx, dy = xs[j] - xs[i], ys[j] - ys[i]
+                length = (dx*dx + dy*dy)**(1/2)
+                tension = k * (length - rest) / max(length, 1e-12)
+                fxs[i] += tension * dx
+                fys[i] += tension * dy
+                fxs[j] -= tension * dx
+                fys[j] -= tension * dy
+            for i, inverse_mass in enumerate(self.inverse_masses):
+                if inverse_mass:
+                    vxs[i] = (vxs[i] + dt * fxs[i] * inverse_mass) * decay
+                    vys[i] = (vys[i] + dt * fys[i] * inverse_mass) * decay
+                    xs[i] += dt * vxs[i]
+                    ys[i] += dt * vys[i]
+
+    def fastest_speed(self) -> float:
+        """The speed of the fastest moving node, used to tell when the structure has settled"""
+        return max(((vx*vx + vy*vy)**(1/2) for vx, vy in zip(self.vxs, self.vys)), default=0)
+
+
+def member_utilisation(model: structure.Model, forces: list) -> list:
+    """Works out how close each beam of the model is to failing from the axial forces (in the order
+    of the beams in the model). A beam in tension fails when its stress reaches the yield stress and
+    a beam in compression also fails when the force reaches the Euler buckling load (pi^2 E I / L^2,
+    both ends pinned). Returns the utilisation of each beam, 1 or more means it has failed.
+    The beams are all checked at once with numpy if it is installed."""
+    sections = model.sections
+    if numpy is not None and forces:
+        # the properties of each section, then picked out for each beam by its section index
+        ids = numpy.frombuffer(model.beam_sections, dtype=numpy.uint16)
+        area = numpy.array([i.area for i in sections])[ids]
+        yield_force = area * numpy.array([i.yield_stress for i in sections])[ids]
+        stiffness = numpy.array([math.pi**2 * i.youngs_modulus * i.second_moment for i in sections])[ids]
+        xs, ys = numpy.frombuffer(model.xs), numpy.frombuffer(model.ys)
+        starts = numpy.frombuffer(model.beam_starts, dtype=numpy.dtype(f"i{model.beam_starts.itemsize}"))
+        ends = numpy.frombuffer(model.beam_ends, dtype=numpy.dtype(f"i{model.beam_ends.itemsize}"))
+        length_squared = (xs[ends] - xs[starts])**2 + (ys[ends] - ys[starts])**2
+
+        forces = numpy.asarray(forces, dtype=float)
+        utilisation = numpy.abs(forces) / yield_force
+        compressed = forces < 0
+        buckling = -forces[compressed] * length_squared[compressed] / stiffness[compressed]
+        utilisation[compressed] = numpy.maximum(utilisation[compressed], buckling)
+        return utilisation.tolist()
+
+    xs, ys = model.xs, model.ys
+    utilisation = []
+    for i, j, section_id, force in zip(model.beam_starts, model.beam_ends, model.beam_sections, forces):
+        section = sections[section_id]
+        value = abs(force) / (section.area * section.yield_stress)
+        if force < 0:
+            length_squared = (xs[j] - xs[i])**2 + (ys[j] - ys[i])**2
+            value = max(value, -force * length_squared / (math.pi**2 * section.youngs_modulus * section.second_moment))
+        utilisation.append(value)
+    return utilisation
@@ -0,0 +1,82 @@
+import collections
+import contextlib
+import json
+import time
+import pygame
+
+# returned when the profiler is off so timing a section costs almost nothing
+_NOT_TIMING = contextlib.nullcontext()
+
+
+class Profiler:
+    """Times the phases of each frame and counts things (e.g. how many beams were drawn).
+    It keeps a rolling record of the last few frames which can be shown on the screen or saved."""
+    def __init__(self, trace_length: int = 600):
+        self.enabled = False
+        self.phases = {}  # phase -> milliseconds spent in it this frame
+        self.counters = {}
+        self.last_frame = {}  # the phases and counters of the last finished frame
+        self.fps = 0
+        self.trace = collections.deque(maxlen=trace_length)
+        self._frame_start = time.perf_counter()
+
+    def section(self, name: str):
+        """Use as 'with profiler.section(name):' to time the code inside"""
+        if not self.enabled:
+            return _NOT_TIMING
+        return self._timer(name)
+
+    @contextlib.contextmanager
+    def _timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + (time.perf_counter() - start) * 1000
+
+    def count(self, name: str, value: int):
+        if self.enabled:
+            self.counters[name] = value
+
+    def end_frame(self):
+        """Records the frame that has just finished and starts timing the next one"""
+        now = time.perf_counter()
+        if self.enabled:
+            frame_time = now - self._frame_start
+            self.fps = 1 / frame_time if frame_time > 0 else 0
+            self.last_frame = {"time": now, "frame_ms": frame_time * 1000,
+                               "phases": self.phases, "counters": self.counters}
+            self.trace.append(self.last_frame)
+            self.phases = {}
+            self.counters = {}
+        self._frame_start = now
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.phases, self.counters = {}, {}
+
+    def dump(self, path: str):
+        """Saves the rolling record of frames to a file with one json object per line"""
+        with open(path, "w") as file:
+            for frame in self.trace:
+                file.write(json.dumps(frame) + "\n")
+
+    def draw(self, canvas: pygame.Surface, font: pygame.font.Font, position: tuple) -> pygame.Rect:
+        """Draws the timings of the last frame onto the canvas and returns the area drawn on"""
+        lines = [f"FPS {self.fps:.1f}  frame {self.last_frame.get('frame_ms', 0):.2f} ms"]
+        lines += [f"{name} {ms:.2f} ms" for name, ms in self.last_frame.get("phases", {}).items()]
+        lines += [f"{name} {value}" for name, value in self.last_frame.get("counters", {}).items()]
+        rendered = [font.render(i, True, (255, 255, 255)) for i in lines]
+        width = max(i.get_width() for i in rendered) + 20
+        height = sum(i.get_height() for i in rendered) + 20
+
+        background = pygame.Surface((width, height))
+        background.set_alpha(180)
+        background.fill((0, 0, 0))
+        x, y = position
+        rect = canvas.blit(background, (x - width, y))
+        y += 10
+        for i in rendered:
+            canvas.blit(i, (x - width + 10, y))
+            y += i.get_height()
+        return rect
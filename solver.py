@@ -0,0 +1,118 @@
+import array
+import threading
+import physics
+import storage
+
+
+class Cancelled(Exception):
+    """Raised part way through a solve when a newer structure has been sent to the solver"""
+
+
+class Solution:
+    """The result of resolving a snapshot of a model. The reactions are stored against the index of the
+    fixed node in the model and the beam forces are in the order of the beams in the model.
+    error says why the structure could not be solved (if it could not)."""
+    def __init__(self, version, structure_version, complete, method=None, reactions=None, beam_forces=None,
+                 error=None):
+        self.version = version
+        self.structure_version = structure_version
+        self.complete = complete
+        self.method = method
+        self.reactions = reactions or {}
+        self.beam_forces = beam_forces or []
+        self.error = error
+
+
+def solve(version: int, structure_version: int, arrays: storage.StructureArrays, sections: tuple = None,
+          check=None) -> Solution:
+    """Resolves a structure from its arrays and (if given) the sections of the model with the index of
+    the section of each beam. check is called every so often and can raise an exception to stop the solve."""
+    nodes, fixed, beams = storage.structures_from_arrays(arrays)
+    if sections is not None:
+        table, ids = sections
+        for beam, i in zip(beams, ids):
+            beam.section = table[i]
+    fixed_indices = [i for i, flag in enumerate(arrays.fixed) if flag]
+    if check is not None:
+        check()
+    if not physics.check_complete(nodes, fixed, beams):
+        return Solution(version, structure_version, False)
+
+    try:
+        physics.solve_truss(nodes, fixed, beams, check)
+        method = "truss"
+    except Cancelled:
+        raise
+    except Exception:
+        # the structure is not a stable truss so only the vertical forces can be found
+        try:
+            physics.calculate_fixed(nodes, fixed, beams)
+        except Exception as error:
+            return Solution(version, structure_version, False, error=str(error))
+        for i in fixed:
+            i.horizontal_force = 0
+        method = "vertical"
+    reactions = {index: (i.horizontal_force, i.vertical_force) for index, i in zip(fixed_indices, fixed)}
+    return Solution(version, structure_version, True, method, reactions, [i.force for i in beams])
+
+
+class BackgroundSolver:
+    """Resolves the structure on another thread so the window does not freeze.
+    Only the newest structure sent is solved - one waiting is replaced and one being solved is stopped.
+    on_finished is called (on the solver's thread) whenever a new solution is ready."""
+    def __init__(self, on_finished=None):
+        self.on_finished = on_finished
+        self._condition = threading.Condition()
+        self._pending = None  # the newest snapshot waiting to be solved
+        self._generation = 0  # increased with every request so old solves know to stop
+        self._result = None
+        self.solving = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        return self.solving or self._pending is not None
+
+    def request(self, model):
+        """Sends a snapshot of the model to be solved, replacing anything sent before"""
+        sections = list(model.sections), array.array("H", model.beam_sections)
+        snapshot = model.version, model.structure_version, storage.arrays_from_model(model), sections
+        with self._condition:
+            self._generation += 1
+            self._pending = self._generation, snapshot
+            self._condition.notify()
+
+    def take_result(self):
+        """Returns the newest solution (only once) or None if there is not a new one"""
+        with self._condition:
+            result, self._result = self._result, None
+        return result
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None:
+                    self._condition.wait()
+                generation, snapshot = self._pending
+                self._pending = None
+                self.solving = True
+
+            def check():
+                if generation != self._generation:
+                    raise Cancelled()
+
+            try:
+                solution = solve(*snapshot, check)
+            except Cancelled:
+                self.solving = False
+                continue
+            except Exception as error:
+                # anything else going wrong must not stop the thread or nothing would ever be solved again
+                version, structure_version = snapshot[:2]
+                solution = Solution(version, structure_version, False, error=str(error))
+            with self._condition:
+                self._result = solution
+                self.solving = False
+            if self.on_finished is not None:
+                self.on_finished()
@@ -0,0 +1,186 @@
+import math
+
+
+class SpatialGrid:
+    """A uniform hash grid that stores items by their position so that the items near a point
+    or inside a box can be found by only looking at the cells around them"""
+    def __init__(self, cell_size: float = 1):
+        self.cell_size = cell_size
+        self._cells = {}  # cell -> set of the items in that cell
+        self._positions = {}  # item -> (position, cell)
+        # the range of cells that have ever been used so the nearest search knows when to stop
+        self._bounds = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, item):
+        return item in self._positions
+
+    def _cell(self, position: tuple) -> tuple:
+        x, y = position
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, item, position: tuple):
+        """Adds an item at the given position"""
+        cell = self._cell(position)
+        self._cells.setdefault(cell, set()).add(item)
+        self._positions[item] = position, cell
+        cx, cy = cell
+        if self._bounds is None:
+            self._bounds = cx, cy, cx, cy
+        else:
+            x1, y1, x2, y2 = self._bounds
+            self._bounds = min(x1, cx), min(y1, cy), max(x2, cx), max(y2, cy)
+
+    def remove(self, item):
+        """Removes an item from the grid"""
+        _, cell = self._positions.pop(item)
+        items = self._cells[cell]
+        items.discard(item)
+        if not items:
+            del self._cells[cell]
+
+    def move(self, item, position: tuple):
+        """Changes the position of an item that is already in the grid"""
+        _, cell = self._positions[item]
+        if self._cell(position) == cell:  # most small movements stay in the same cell
+            self._positions[item] = position, cell
+        else:
+            self.remove(item)
+            self.insert(item, position)
+
+    def position(self, item) -> tuple:
+        return self._positions[item][0]
+
+    def distance(self, item, position: tuple) -> float:
+        (x1, y1), _ = self._positions[item]
+        x, y = position
+        return ((x1 - x)**2 + (y1 - y)**2)**(1/2)
+
+    def nearest(self, position: tuple):
+        """Returns the item nearest to the position or None if the grid is empty"""
+        if not self._positions:
+            return None
+        cx, cy = self._cell(position)
+        x1, y1, x2, y2 = self._bounds
+        # the furthest ring that could have anything in it
+        furthest = max(abs(cx - x1), abs(cx - x2), abs(cy - y1), abs(cy - y2))
+
+        closest = None
+        distance = math.inf
+        visited = 0
+        for ring in range(furthest + 1):
+            # anything in this ring or further is at least this far away
+            if (ring - 1) * self.cell_size >= distance:
+                break
+            if visited > 4 * len(self._cells):
+                # the point is far from everything so checking every item is quicker
+                return min(self._positions, key=lambda item: self.distance(item, position))
+            for cell in self._ring(cx, cy, ring):
+                visited += 1
+                for item in self._cells.get(cell, ()):
+                    temp_distance = self.distance(item, position)
+                    if temp_distance < distance:
+                        closest = item
+                        distance = temp_distance
+        return closest
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        """Gives the cells that are exactly ring cells away from the centre cell"""
+        if ring == 0:
+            yield cx, cy
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield x, cy - ring
+            yield x, cy + ring
+        for y in range(cy - ring + 1, cy + ring):
+            yield cx - ring, y
+            yield cx + ring, y
+
+    def query_box(self, x1: float, y1: float, x2: float, y2: float) -> list:
+        """Returns the items strictly inside the box"""
+        cx1, cy1 = self._cell((x1, y1))
+        cx2, cy2 = self._cell((x2, y2))
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) <= len(self._cells):
+            cells = (self._cells.get((x, y), ()) for x in range(cx1, cx2 + 1) for y in range(cy1, cy2 + 1))
+        else:  # a big box, so only look at the cells that are in use
+            cells = (items for (x, y), items in self._cells.items() if cx1 <= x <= cx2 and cy1 <= y <= cy2)
+
+        found = []
+        for items in cells:
+            for item in items:
+                x, y = self._positions[item][0]
+                if x1 < x < x2 and y1 < y < y2:
+                    found.append(item)
+        return found
+
+
+class StructureIndex:
+    """Keeps the nodes (by position) and beams (by centre) in spatial grids. It listens to the nodes
+    so that moving a node also moves it and its beams in the grids."""
+    def __init__(self, cell_size: float = 1):
+        self.nodes = SpatialGrid(cell_size)
+        self.beams = SpatialGrid(cell_size)
+        self._node_beams = {}  # the beams that need moving when a node moves
+        # the longest a beam has been, so anything within half of it of a box could cross it
+        self.longest_beam = 0
+
+    def add_node(self, node):
+        self.nodes.insert(node, node.position)
+        self._node_beams[node] = set()
+        node.add_listener(self.node_moved)
+
+    def remove_node(self, node):
+        self.nodes.remove(node)
+        del self._node_beams[node]
+        node.remove_listener(self.node_moved)
+
+    def _update_longest(self, beam):
+        length = beam.length
+        if length > self.longest_beam:
+            self.longest_beam = length
+
+    def add_beam(self, beam):
+        self.beams.insert(beam, beam.centre)
+        self._update_longest(beam)
+        self._node_beams[beam.node1].add(beam)
+        self._node_beams[beam.node2].add(beam)
+
+    def remove_beam(self, beam):
+        self.beams.remove(beam)
+        for node in (beam.node1, beam.node2):
+            if node in self._node_beams:
+                self._node_beams[node].discard(beam)
+
+    def node_moved(self, node):
+        """Called by the node whenever its position is changed"""
+        self.nodes.move(node, node.position)
+        for beam in self._node_beams[node]:
+            self.beams.move(beam, beam.centre)
+            self._update_longest(beam)
+
+    def nearest(self, position: tuple):
+        """Returns the nearest node or beam (using the centre of the beam) to the position"""
+        node = self.nodes.nearest(position)
+        beam = self.beams.nearest(position)
+        if node is None or beam is None:
+            return beam if node is None else node
+        if self.beams.distance(beam, position) < self.nodes.distance(node, position):
+            return beam
+        return node
+
+    def beams_crossing_box(self, x1: float, y1: float, x2: float, y2: float) -> list:
+        """Returns the beams that have any part inside the box (using their bounding boxes)"""
+        margin = self.longest_beam / 2
+        found = []
+        for beam in self.beams.query_box(x1 - margin, y1 - margin, x2 + margin, y2 + margin):
+            (bx1, by1), (bx2, by2) = beam.ends
+            if min(bx1, bx2) <= x2 and max(bx1, bx2) >= x1 and min(by1, by2) <= y2 and max(by1, by2) >= y1:
+                found.append(beam)
+        return found
+
+    def query_box(self, x1: float, y1: float, x2: float, y2: float) -> list:
+        """Returns the nodes and beams (by their centre) strictly inside the box"""
+        return self.nodes.query_box(x1, y1, x2, y2) + self.beams.query_box(x1, y1, x2, y2)
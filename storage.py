@@ -0,0 +1,301 @@
+import argparse
+import array
+import json
+import mmap
+import struct
+import sys
+import time
+import structure
+
+# The binary format is a small header followed by the packed arrays (all little endian):
+#   header   - magic, version, node count, beam count (padded to 32 bytes)
+#   coords   - float64 x, y for each node
+#   fixed    - uint8 flag for each node saying if it is fixed (padded to a multiple of 8 bytes)
+#   beams    - int32 pair of node indices for each beam
+MAGIC = b"BRDG"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxQQ")
+HEADER_SIZE = 32
+BINARY_EXTENSION = ".bridge"
+
+# Line files have one record per line, the values separated by commas or spaces (lines starting with # are ignored):
+#   node, x, y            - a node
+#   fixed, x, y           - a fixed node (or makes the node already there fixed)
+#   beam, x1, y1, x2, y2  - a beam between the nodes at the two ends (made if they are not there yet)
+# "point" and "line" can be used instead of node and beam like in a DXF file.
+LINES_EXTENSION = ".lines.csv"  # not just .csv so exported results are not taken for line files
+NODE_RECORDS = {"node": False, "point": False, "fixed": True}  # record -> whether the node is fixed
+BEAM_RECORDS = ("beam", "line")
+IMPORT_TOLERANCE = 1e-6  # nodes closer than about this are treated as the same node
+
+
+def to_lists(nodes: list, fixed: list, beams: list) -> tuple:
+    """Turns the structures into plain lists of the coordinates of the nodes and fixed nodes
+    and the pairs of indices of the nodes each beam joins (indexing nodes + fixed)"""
+    index = {node: i for i, node in enumerate(nodes + fixed)}
+    return ([list(i.position) for i in nodes],
+            [list(i.position) for i in fixed],
+            [[index[i.node1], index[i.node2]] for i in beams])
+
+
+def from_lists(node_coords: list, fixed_coords: list, beam_pairs: list) -> tuple:
+    """Turns the plain lists back into the nodes, fixed nodes and beams"""
+    nodes = [structure.Node(tuple(i)) for i in node_coords]
+    fixed = [structure.FixedNode(tuple(i)) for i in fixed_coords]
+    every_node = nodes + fixed
+    beams = [structure.Beam(every_node[a], every_node[b]) for a, b in beam_pairs]
+    return nodes, fixed, beams
+
+
+class StructureArrays:
+    """The packed arrays of a structure - coords holds x, y for each node, fixed holds a flag for
+    each node and beams holds the pair of node indices for each beam. When loaded from a file
+    these are memoryviews onto the memory mapped file so nothing is read until it is used."""
+    def __init__(self, coords, fixed, beams, file_map=None):
+        self.coords = coords
+        self.fixed = fixed
+        self.beams = beams
+        self._map = file_map
+
+    @property
+    def node_count(self):
+        return len(self.fixed)
+
+    @property
+    def beam_count(self):
+        return len(self.beams) // 2
+
+    def close(self):
+        """Releases the memory map (the arrays cannot be used afterwards)"""
+        if self._map is not None:
+            for view in (self.coords, self.fixed, self.beams):
+                if isinstance(view, memoryview):
+                    view.release()
+            self._map.close()
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def arrays_from_structures(nodes: list, fixed: list, beams: list) -> StructureArrays:
+    """Packs the structures into arrays, the nodes come before the fixed nodes"""
+    index = {node: i for i, node in enumerate(nodes + fixed)}
+    coords = array.array("d")
+    for node in nodes + fixed:
+        coords.extend(node.position)
+    flags = array.array("B", bytes(len(nodes))) + array.array("B", [1]) * len(fixed)
+    pairs = array.array("i")
+    for beam in beams:
+        pairs.extend((index[beam.node1], index[beam.node2]))
+    return StructureArrays(coords, flags, pairs)
+
+
+def arrays_from_model(model: structure.Model) -> StructureArrays:
+    """Packs a model into arrays, keeping the order of its nodes and beams"""
+    coords = array.array("d", bytes(16 * len(model.xs)))
+    coords[0::2], coords[1::2] = model.xs, model.ys
+    pairs = array.array("i", bytes(8 * len(model.beam_starts)))
+    pairs[0::2], pairs[1::2] = array.array("i", model.beam_starts), array.array("i", model.beam_ends)
+    return StructureArrays(coords, array.array("B", model.fixed), pairs)
+
+
+def structures_from_arrays(arrays: StructureArrays) -> tuple:
+    """Turns the arrays back into the nodes, fixed nodes and beams"""
+    coords = arrays.coords
+    every_node = [structure.FixedNode((coords[2*i], coords[2*i+1])) if flag
+                  else structure.Node((coords[2*i], coords[2*i+1]))
+                  for i, flag in enumerate(arrays.fixed)]
+    pairs = arrays.beams
+    beams = [structure.Beam(every_node[pairs[2*i]], every_node[pairs[2*i+1]]) for i in range(arrays.beam_count)]
+    nodes = [i for i in every_node if not isinstance(i, structure.FixedNode)]
+    fixed = [i for i in every_node if isinstance(i, structure.FixedNode)]
+    return nodes, fixed, beams
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+def save_binary(path: str, arrays: StructureArrays):
+    """Writes the packed arrays to a binary structure file"""
+    coords, flags, pairs = (array.array(code, view) for code, view in
+                            (("d", arrays.coords), ("B", arrays.fixed), ("i", arrays.beams)))
+    if sys.byteorder != "little":
+        coords.byteswap()
+        pairs.byteswap()
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, arrays.node_count, arrays.beam_count).ljust(HEADER_SIZE, b"\0"))
+        coords.tofile(file)
+        flags.tofile(file)
+        file.write(bytes(_padding(len(flags))))
+        pairs.tofile(file)
+
+
+def load_binary(path: str, memory_map: bool = True) -> StructureArrays:
+    """Reads a binary structure file. If memory_map is True the arrays are views onto the file
+    which the operating system only reads as they are used (and can share between processes)"""
+    with open(path, "rb") as file:
+        if memory_map:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = file.read()
+
+    magic, version, node_count, beam_count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise Exception("The file is not a structure file")
+    if version != VERSION:
+        raise Exception(f"The structure file version ({version}) is not supported")
+    coords_start = HEADER_SIZE
+    fixed_start = coords_start + 16 * node_count
+    beams_start = fixed_start + node_count + _padding(node_count)
+    end = beams_start + 8 * beam_count
+    if len(data) < end:
+        raise Exception("The structure file is incomplete")
+
+    view = memoryview(data)
+    coords = view[coords_start:fixed_start].cast("d")
+    flags = view[fixed_start:fixed_start + node_count]
+    pairs = view[beams_start:end].cast("i")
+    if sys.byteorder != "little":
+        # the file is little endian so it has to be copied and swapped
+        coords, pairs = array.array("d", coords), array.array("i", pairs)
+        coords.byteswap()
+        pairs.byteswap()
+    return StructureArrays(coords, flags, pairs, data if memory_map else None)
+
+
+def read_lines(path: str):
+    """Gives the lines of a file one at a time with their line number, skipping blank lines and comments"""
+    with open(path) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield number, line
+
+
+def parse_records(lines):
+    """Turns each line into a record of its type and its coordinates"""
+    for number, line in lines:
+        values = line.replace(",", " ").split()
+        kind = values[0].lower()
+        try:
+            coords = tuple(map(float, values[1:]))
+        except ValueError:
+            raise Exception(f"Line {number} has a coordinate that is not a number")
+        if not (kind in NODE_RECORDS and len(coords) == 2 or kind in BEAM_RECORDS and len(coords) == 4):
+            raise Exception(f"Line {number} is not a node, fixed or beam record")
+        yield kind, coords
+
+
+def import_records(records, tolerance: float = IMPORT_TOLERANCE, report=None) -> StructureArrays:
+    """Builds the arrays of a structure from the records. Nodes whose coordinates round to the same multiple
+    of the tolerance are the same node and beams that join the same nodes are only added once.
+    Only the arrays and the lookups of the nodes and beams seen so far are kept, not the records,
+    so the file is never all in memory. report is called with the number of records and the time taken
+    every 100000 records and once at the end."""
+    coords = array.array("d")
+    flags = array.array("B")
+    pairs = array.array("i")
+    nodes = {}  # rounded coordinates -> node index
+    beams = set()  # the node indices of each beam packed into one number
+    start = time.perf_counter()
+
+    def node_index(x, y):
+        key = round(x / tolerance), round(y / tolerance)
+        index = nodes.get(key)
+        if index is None:
+            index = nodes[key] = len(flags)
+            coords.extend((x, y))
+            flags.append(0)
+        return index
+
+    count = 0
+    for count, (kind, values) in enumerate(records, 1):
+        if kind in NODE_RECORDS:
+            index = node_index(*values)
+            if NODE_RECORDS[kind]:
+                flags[index] = 1
+        else:
+            a, b = node_index(values[0], values[1]), node_index(values[2], values[3])
+            key = min(a, b) << 32 | max(a, b)
+            if a != b and key not in beams:  # beams with no length or already added are skipped
+                beams.add(key)
+                pairs.extend((a, b))
+        if report is not None and count % 100000 == 0:
+            report(count, time.perf_counter() - start)
+    if report is not None:
+        report(count, time.perf_counter() - start)
+    return StructureArrays(coords, flags, pairs)
+
+
+def import_lines(path: str, tolerance: float = IMPORT_TOLERANCE, report=None) -> StructureArrays:
+    """Streams a line file into the arrays of a structure"""
+    return import_records(parse_records(read_lines(path)), tolerance, report)
+
+
+def save_lines(path: str, nodes: list, fixed: list, beams: list):
+    """Writes the structure as a line file, the nodes without beams are written as node records"""
+    joined = {node for beam in beams for node in (beam.node1, beam.node2)}
+    with open(path, "w") as file:
+        file.writelines(f"fixed,{x!r},{y!r}\n" for x, y in (i.position for i in fixed))
+        file.writelines(f"node,{x!r},{y!r}\n" for x, y in (i.position for i in nodes if i not in joined))
+        file.writelines(f"beam,{x1!r},{y1!r},{x2!r},{y2!r}\n" for (x1, y1), (x2, y2) in (i.ends for i in beams))
+
+
+def save_structure(path: str, nodes: list, fixed: list, beams: list):
+    """Saves the structure, as a binary file if the path ends in .bridge,
+    a line file if it ends in .lines.csv otherwise as json"""
+    if path.endswith(BINARY_EXTENSION):
+        save_binary(path, arrays_from_structures(nodes, fixed, beams))
+        return
+    if path.endswith(LINES_EXTENSION):
+        save_lines(path, nodes, fixed, beams)
+        return
+    node_coords, fixed_coords, beam_pairs = to_lists(nodes, fixed, beams)
+    with open(path, "w") as file:
+        json.dump({"nodes": node_coords, "fixed": fixed_coords, "beams": beam_pairs}, file)
+
+
+def load_structure(path: str) -> tuple:
+    """Loads a structure saved by save_structure and returns the nodes, fixed nodes and beams"""
+    if path.endswith(BINARY_EXTENSION):
+        with load_binary(path) as arrays:
+            return structures_from_arrays(arrays)
+    if path.endswith(LINES_EXTENSION):
+        return structures_from_arrays(import_lines(path))
+    with open(path) as file:
+        data = json.load(file)
+    return from_lists(data["nodes"], data["fixed"], data["beams"])
+
+
+def main(args=None):
+    """Converts a structure file to another format, e.g. a large line file to a binary file"""
+    parser = argparse.ArgumentParser(description="Converts a structure between the json, .bridge "
+                                                 "and .lines.csv formats")
+    parser.add_argument("source", help="structure file to read")
+    parser.add_argument("destination", help="structure file to write")
+    parser.add_argument("-t", "--tolerance", type=float, default=IMPORT_TOLERANCE,
+                        help="nodes in a line file closer than this are joined")
+    args = parser.parse_args(args)
+
+    def report(count, elapsed):
+        print(f"{count} records in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f} per second)", file=sys.stderr)
+
+    if args.source.endswith(LINES_EXTENSION):
+        arrays = import_lines(args.source, args.tolerance, report)
+        if args.destination.endswith(BINARY_EXTENSION):
+            # straight from the arrays so there is never an object for each node and beam
+            save_binary(args.destination, arrays)
+            return
+        structures = structures_from_arrays(arrays)
+    else:
+        structures = load_structure(args.source)
+    save_structure(args.destination, *structures)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import array
 import math
 
 
@@ -16,20 +17,30 @@ def nearest_structure(structures: list, position: tuple):
     struc = None
     distance = math.inf
     for i in structures:
-        if distance_from(i, position) < distance:
+        temp_distance = distance_from(i, position)
+        if temp_distance < distance:
             struc = i
-            distance = distance_from(i, position)
+            distance = temp_distance
     return struc
 
 
 class Node:
+    # slots stop every node carrying a dictionary which matters with large structures
+    __slots__ = ("_position", "_model", "_index", "_listeners", "version")
+
     def __init__(self, position: tuple):
-        self._position = position
+        self._position = position  # only used while the node is not in a model
+        self._model = None
+        self._index = None
+        self._listeners = ()  # functions that are called whenever the node is moved
+        self.version = 0  # increased whenever the node is moved so the beams know to update their geometry
 
     @property
     def position(self):
         """Returns the position of the node"""
-        return self._position
+        if self._model is None:
+            return self._position
+        return self._model.xs[self._index], self._model.ys[self._index]
 
     @position.setter
     def position(self, position: tuple):
@@ -38,10 +49,33 @@ class Node:
             raise TypeError(f"The attempted position change was an invalid data type ({type(position)})")
         if len(position) != 2:
             raise TypeError("The attempted position change was an invalid length")
-        self._position = position
+        if self._model is None:
+            self._position = position
+        else:
+            self._model.xs[self._index], self._model.ys[self._index] = position
+            self._model.version += 1
+        self.version += 1
+        for listener in self._listeners:
+            listener(self)
+
+    def add_listener(self, listener):
+        """Adds a function that will be called with the node whenever it is moved"""
+        self._listeners += (listener,)
+
+    def remove_listener(self, listener):
+        listeners = list(self._listeners)
+        listeners.remove(listener)
+        self._listeners = tuple(listeners)
+
+    @property
+    def index(self):
+        """Returns the index of the node in the arrays of its model"""
+        return self._index
 
 
 class FixedNode(Node):
+    __slots__ = ("vertical_force", "horizontal_force")
+
     def __init__(self, position: tuple):
         super().__init__(position)
         self.vertical_force = 0
@@ -50,14 +84,53 @@ class FixedNode(Node):
 
 MASS_PER_LENGTH = 1
 GRAVITY = 9.81
+YOUNGS_MODULUS = 200e9  # steel
+CROSS_SECTION_AREA = 0.001
+YIELD_STRESS = 250e6  # steel
+
+
+class Section:
+    """The cross section and material of a beam. Sections with the same values are equal
+    so a model only stores each different one once."""
+    __slots__ = ("area", "second_moment", "youngs_modulus", "yield_stress", "mass_per_length")
+
+    def __init__(self, area: float, second_moment: float, youngs_modulus: float, yield_stress: float,
+                 mass_per_length: float):
+        if area <= 0 or second_moment <= 0:
+            raise Exception("A section must have a positive area and second moment of area")
+        self.area = area
+        self.second_moment = second_moment  # resists the beam bending, so buckling
+        self.youngs_modulus = youngs_modulus
+        self.yield_stress = yield_stress
+        self.mass_per_length = mass_per_length
+
+    def _values(self):
+        return self.area, self.second_moment, self.youngs_modulus, self.yield_stress, self.mass_per_length
+
+    def __eq__(self, other):
+        return isinstance(other, Section) and self._values() == other._values()
+
+    def __hash__(self):
+        return hash(self._values())
+
+
+# a solid round bar, the second moment of area of a circle is area^2 / (4 pi)
+DEFAULT_SECTION = Section(CROSS_SECTION_AREA, CROSS_SECTION_AREA**2 / (4 * math.pi), YOUNGS_MODULUS,
+                          YIELD_STRESS, MASS_PER_LENGTH)
 
 
 class Beam:
-    def __init__(self, node1: Node, node2: Node):
+    __slots__ = ("node1", "node2", "force", "_section", "_model", "_index", "_geometry", "_geometry_key")
+
+    def __init__(self, node1: Node, node2: Node, section: Section = DEFAULT_SECTION):
+        self._model = None
+        self._index = None
         self.node1 = node1
         self.node2 = node2
-        self.mass = ((node1.position[0] - node2.position[0])**2 +
-                     (node1.position[1] - node2.position[1])**2)**(1/2) * MASS_PER_LENGTH
+        self._geometry = None  # (length, mass, weight, centre) worked out when they are first needed
+        self._geometry_key = None  # the versions of the nodes (and the section) the geometry is for
+        self.section = section
+        self.force = 0  # the axial force in the beam, positive is tension
 
     def __eq__(self, other):
         if not isinstance(other, Beam):
@@ -66,12 +139,33 @@ class Beam:
         return (self.node1 is other.node1 and self.node2 is other.node2) \
                or (self.node1 is other.node2 and self.node2 is other.node1)
 
+    def __hash__(self):
+        # beams joining the same nodes are equal whichever way round they are
+        return hash(frozenset((id(self.node1), id(self.node2))))
+
+    def _get_geometry(self) -> tuple:
+        # only worked out again if either node has moved (or the section changed) since last time
+        key = self.node1.version, self.node2.version, self._section
+        if key != self._geometry_key:
+            (x1, y1), (x2, y2) = self.node1.position, self.node2.position
+            length = ((x2 - x1)**2 + (y2 - y1)**2)**(1/2)
+            mass = length * self._section.mass_per_length
+            self._geometry = length, mass, mass * GRAVITY, ((x1 + x2)/2, (y1 + y2)/2)
+            self._geometry_key = key
+        return self._geometry
+
+    @property
+    def length(self):
+        return self._get_geometry()[0]
+
+    @property
+    def mass(self):
+        return self._get_geometry()[1]
+
     @property
     def centre(self):
         """Returns the position of the centre of the beam"""
-        x1, y1 = self.node1.position
-        x2, y2 = self.node2.position
-        return (x1 + x2)/2, (y1 + y2)/2
+        return self._get_geometry()[3]
 
     @property
     def ends(self):
@@ -81,4 +175,147 @@ class Beam:
     @property
     def weight(self):
         """Returns the weight of the beam"""
-        return self.mass * GRAVITY
+        return self._get_geometry()[2]
+
+    @property
+    def section(self):
+        return self._section
+
+    @section.setter
+    def section(self, section: Section):
+        self._section = section
+        if self._model is not None:
+            self._model.beam_sections[self._index] = self._model.section_id(section)
+            self._model.version += 1
+
+    @property
+    def index(self):
+        """Returns the index of the beam in the arrays of its model"""
+        return self._index
+
+
+class Model:
+    """Stores the structure as arrays (struct of arrays) rather than as lots of separate objects.
+    The node positions, which nodes are fixed and the indices of the nodes each beam joins are all kept
+    in contiguous arrays so the solver and renderer can loop over them directly.
+    The Node and Beam objects added to the model become views onto these arrays."""
+    def __init__(self):
+        self.xs = array.array("d")
+        self.ys = array.array("d")
+        self.fixed = array.array("B")
+        self.beam_starts = array.array("l")  # the index of node1 of each beam
+        self.beam_ends = array.array("l")  # the index of node2 of each beam
+        self.beam_sections = array.array("H")  # the index in sections of the section of each beam
+        self.sections = []  # each different section used by the beams
+        self._section_ids = {}  # section -> its index in sections
+        self.nodes = []  # the node views in the same order as the arrays
+        self.beams = []  # the beam views in the same order as the arrays
+        self._adjacent = {}  # node -> the set of beams joined to it
+        self._beam_set = set()  # for checking for duplicate beams in O(1)
+        self.version = 0  # increased whenever the model is changed
+        self.structure_version = 0  # only increased when nodes or beams are added or removed
+
+    def add_node(self, node: Node):
+        if node._model is not None:
+            raise Exception("The node is already in a model")
+        x, y = node._position
+        node._index = len(self.nodes)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.fixed.append(isinstance(node, FixedNode))
+        self.nodes.append(node)
+        self._adjacent[node] = set()
+        node._model = self
+        node._position = None
+        self.version += 1
+        self.structure_version += 1
+
+    def remove_node(self, node: Node):
+        """Removes the node, any beams still joined to it must be removed first"""
+        if node._model is not self:
+            raise Exception("The node is not in this model")
+        if self._adjacent[node]:
+            raise Exception("The beams joined to the node must be removed first")
+        del self._adjacent[node]
+        index = node._index
+        node._position = node.position  # the node keeps its position once it is removed
+        node._model = node._index = None
+
+        # move the last node into the gap so the arrays stay contiguous
+        last = len(self.nodes) - 1
+        moved = self.nodes.pop()
+        if moved is not node:
+            self.nodes[index] = moved
+            moved._index = index
+            self.xs[index], self.ys[index], self.fixed[index] = self.xs[last], self.ys[last], self.fixed[last]
+            # only the beams joined to the moved node need their indices changing
+            for beam in self._adjacent[moved]:
+                if self.beam_starts[beam._index] == last:
+                    self.beam_starts[beam._index] = index
+                if self.beam_ends[beam._index] == last:
+                    self.beam_ends[beam._index] = index
+        del self.xs[last], self.ys[last], self.fixed[last]
+        self.version += 1
+        self.structure_version += 1
+
+    def add_beam(self, beam: Beam):
+        if beam.node1._model is not self or beam.node2._model is not self:
+            raise Exception("The beam must join nodes that are in the model")
+        if beam in self._beam_set:
+            raise Exception("The beam is already in the model")
+        beam._index = len(self.beams)
+        self.beam_starts.append(beam.node1._index)
+        self.beam_ends.append(beam.node2._index)
+        self.beam_sections.append(self.section_id(beam.section))
+        self.beams.append(beam)
+        self._beam_set.add(beam)
+        self._adjacent[beam.node1].add(beam)
+        self._adjacent[beam.node2].add(beam)
+        beam._model = self
+        self.version += 1
+        self.structure_version += 1
+
+    def remove_beam(self, beam: Beam):
+        if beam._model is not self:
+            raise Exception("The beam is not in this model")
+        self._beam_set.discard(beam)
+        self._adjacent[beam.node1].discard(beam)
+        self._adjacent[beam.node2].discard(beam)
+        index = beam._index
+        beam._model = beam._index = None
+
+        last = len(self.beams) - 1
+        moved = self.beams.pop()
+        if moved is not beam:
+            self.beams[index] = moved
+            moved._index = index
+            self.beam_starts[index], self.beam_ends[index] = self.beam_starts[last], self.beam_ends[last]
+            self.beam_sections[index] = self.beam_sections[last]
+        del self.beam_starts[last], self.beam_ends[last], self.beam_sections[last]
+        self.version += 1
+        self.structure_version += 1
+
+    def section_id(self, section: Section) -> int:
+        """Returns the index of the section in sections, adding it if it is new
+        (sections are never removed as there are only ever a few of them)"""
+        if section not in self._section_ids:
+            self._section_ids[section] = len(self.sections)
+            self.sections.append(section)
+        return self._section_ids[section]
+
+    def set_positions(self, indices: list, xs: list, ys: list):
+        """Moves many nodes at once by writing straight into the arrays. The nodes' listeners are not
+        told, so this is only for showing a temporary shape (such as a simulation) that is put back after."""
+        model_xs, model_ys = self.xs, self.ys
+        for i, x, y in zip(indices, xs, ys):
+            model_xs[i] = x
+            model_ys[i] = y
+        self.version += 1
+
+    def beams_of(self, node: Node) -> set:
+        """Returns the beams joined to the node (this is the model's own set so copy it before changing the model)"""
+        return self._adjacent[node]
+
+    def contains_beam(self, beam: Beam) -> bool:
+        """Returns True if there is already a beam joining the same nodes"""
+        return beam in self._beam_set